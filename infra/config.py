@@ -6,8 +6,10 @@
 Хардкод дефолтов запрещен согласно AI_WORKFLOW.md.
 """
 import os
-import yaml
-import sys
+import copy
+import functools
+import hashlib
+import json
 import logging
 
 # Настройка логгера (можно будет расширить)
@@ -17,22 +19,159 @@ logger = logging.getLogger("config")
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CONFIG_PATH = os.path.join(BASE_DIR, "config.yaml")
 
+# Обязательные параметры узла (nodes.<node>) в config.yaml
+REQUIRED_NODE_PARAMS = frozenset(("host", "user", "key_path", "storage", "storage_path"))
+
+# Суффикс файла-кэша рядом с конфигом (config.yaml -> config.yaml.cache.json)
+CACHE_SUFFIX = ".cache.json"
+
+@functools.lru_cache(maxsize=None)
+def _get_yaml_loader():
+    """
+    Лениво импортирует PyYAML и выбирает загрузчик.
+
+    yaml нужен только при промахе кэша, поэтому импорт отложен до первого
+    парсинга (быстрее старт CLI, например --help).
+    C-биндинг libyaml парсит в разы быстрее чистого Python.
+    Если PyYAML собран без libyaml — используем обычный SafeLoader
+    и один раз предупреждаем об этом.
+
+    :return: Кортеж (модуль yaml, класс загрузчика).
+    """
+    import yaml
+    try:
+        from yaml import CSafeLoader as loader
+    except ImportError:
+        from yaml import SafeLoader as loader
+        logger.warning(
+            "PyYAML built without libyaml: using slow pure-Python SafeLoader. "
+            "Install libyaml bindings (pip install --force-reinstall pyyaml) "
+            "for faster config parsing."
+        )
+    return yaml, loader
+
+def _content_digest(raw):
+    """
+    Хэш содержимого YAML — ключ действительности JSON кэша.
+    В отличие от mtime, не зависит от разрешения времени ФС и не сбрасывается
+    при touch/git checkout без изменения содержимого. blake2b хэширует
+    небольшой файл за микросекунды — на порядки быстрее разбора YAML.
+    """
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def _read_json_cache(config_path, digest):
+    """
+    Читает разобранный конфиг из JSON кэша рядом с YAML файлом.
+    JSON парсится на порядок быстрее YAML, поэтому новый процесс
+    (повторный запуск CLI) не платит за разбор YAML, пока файл не изменился.
+
+    :param digest: Хэш текущего содержимого YAML (_content_digest).
+    :return: Словарь конфигурации или None, если кэша нет или он устарел.
+    """
+    try:
+        with open(config_path + CACHE_SUFFIX, 'rb') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Кэш действителен только для того содержимого YAML, из которого он построен
+    if not isinstance(cached, dict) or cached.get("digest") != digest:
+        return None
+    return cached.get("config")
+
+def _write_json_cache(config_path, digest, config):
+    """
+    Сохраняет разобранный конфиг в JSON кэш (best effort).
+    Если конфиг не переносит JSON без потерь (даты, нестроковые ключи)
+    или каталог недоступен для записи — кэш просто не создается.
+    """
+    try:
+        data = json.dumps({"digest": digest, "config": config})
+        if json.loads(data)["config"] != config:
+            return
+        # Пишем во временный файл и атомарно подменяем: параллельный процесс
+        # никогда не увидит наполовину записанный кэш
+        cache_path = config_path + CACHE_SUFFIX
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.debug("Config JSON cache not written: %s", e)
+
+@functools.lru_cache(maxsize=8)
+def _load_cached(config_path, mtime_ns):
+    """
+    Читает и парсит YAML один раз для пары (путь, mtime).
+    mtime_ns входит в ключ кэша: при изменении файла ключ меняется,
+    и конфиг перечитывается автоматически (явная инвалидация не нужна).
+    """
+    # Читаем файл целиком одним вызовом (без промежуточного буфера) и отдаем
+    # байты парсеру: декодирование UTF-8 выполняет libyaml, минуя TextIOWrapper
+    with open(config_path, 'rb', buffering=0) as f:
+        raw = f.read()
+
+    digest = _content_digest(raw)
+    config = _read_json_cache(config_path, digest)
+    if config is None:
+        yaml, loader = _get_yaml_loader()
+        config = yaml.load(raw, Loader=loader) or {}
+        _write_json_cache(config_path, digest, config)
+
+    return config
+
 def load_config(config_path=CONFIG_PATH):
     """
     Загружает настройки из YAML файла.
-    :return: Словарь с конфигурацией.
+    Повторные вызовы в рамках процесса отдаются из кэша (без I/O и парсинга),
+    пока не изменится mtime файла.
+    :return: Словарь с конфигурацией (копия, изменять можно безопасно).
     """
-    if not os.path.exists(config_path):
-        logger.warning(f"Config file not found at {config_path}. Using empty config.")
-        return {}
-    
     try:
-        with open(config_path, 'r') as f:
-            return yaml.safe_load(f) or {}
+        # os.stat одновременно проверяет существование файла и дает mtime для кэша
+        st = os.stat(config_path)
+        config = _load_cached(os.path.abspath(config_path), st.st_mtime_ns)
+        # deepcopy: вызывающий код может менять словарь, кэш при этом не портится
+        return copy.deepcopy(config)
+    except FileNotFoundError:
+        logger.warning("Config file not found at %s. Using empty config.", config_path)
+        return {}
     except Exception as e:
-        logger.error(f"Error loading config: {e}")
+        logger.error("Error loading config: %s", e)
         return {}
 
+# Сброс кэша разобранных конфигов (например, между тестами) — как у lru_cache
+load_config.cache_clear = _load_cached.cache_clear
+
+@functools.lru_cache(maxsize=64)
+def _expand_key_path(key_path):
+    """
+    Раскрывает ~ в пути к ключу один раз на путь (без обращения к окружению
+    при каждом get_node_params).
+    """
+    return os.path.expanduser(key_path)
+
+def get_ssh_backend(config=None):
+    """
+    Возвращает SSH бэкенд из секции ssh конфига (ssh.backend).
+    Если config не передан, загружает его заново.
+
+    Бэкенд должен быть явно указан в config.yaml — дефолт в коде не подставляется.
+
+    :param config: Опциональный словарь конфигурации
+    :return: Имя бэкенда (paramiko, ssh2 или openssh; проверяется в infra.ssh_pool)
+    :raises ValueError: Если секция ssh или ssh.backend отсутствует
+    """
+    if config is None:
+        config = load_config()
+
+    backend = (config.get("ssh") or {}).get("backend")
+    if not backend:
+        raise ValueError(
+            "Missing required parameter 'ssh.backend' in config.yaml. "
+            "Please add it (paramiko, ssh2 or openssh)"
+        )
+    return backend
+
 def get_node_params(node_name, config=None):
     """
     Возвращает параметры подключения для узла.
@@ -45,6 +184,7 @@ def get_node_params(node_name, config=None):
     :param config: Опциональный словарь конфигурации
     :return: Словарь с параметрами узла
     :raises ValueError: Если узел не найден или отсутствуют обязательные параметры
+                        (включая api_verify_ssl при заданном api_token)
     """
     if config is None:
         config = load_config()
@@ -58,24 +198,40 @@ def get_node_params(node_name, config=None):
             f"Available nodes: {list(nodes.keys())}"
         )
     
-    # Проверяем обязательные параметры
-    required_params = ["host", "user", "key_path", "storage", "storage_path"]
-    missing = [p for p in required_params if p not in node_conf]
+    # Проверяем обязательные параметры (разность множеств считается в C)
+    missing = REQUIRED_NODE_PARAMS.difference(node_conf)
     
     if missing:
         raise ValueError(
-            f"Node '{node_name}' missing required parameters: {missing}. "
+            f"Node '{node_name}' missing required parameters: {sorted(missing)}. "
             f"Please add them to config.yaml"
         )
     
+    # Proxmox API (опционально): с токеном проверка сертификата задается явно
+    api_token = node_conf.get("api_token")
+    if api_token and "api_verify_ssl" not in node_conf:
+        raise ValueError(
+            f"Node '{node_name}' has api_token but no api_verify_ssl. "
+            f"Please add it to config.yaml"
+        )
+
+    key = _expand_key_path(node_conf["key_path"])
+
     return {
         "host": node_conf["host"],
         "user": node_conf["user"],
-        "key": os.path.expanduser(node_conf["key_path"]),
+        "key": key,
         "storage": node_conf["storage"],
         "storage_path": node_conf["storage_path"],
         # ram_disk_size_gb теперь опциональный (специфичен для узла)
         # Если не указан - возвращаем None (tmpfs использует дефолт 50% RAM)
-        "ram_disk_size_gb": node_conf.get("ram_disk_size_gb")
+        "ram_disk_size_gb": node_conf.get("ram_disk_size_gb"),
+        # Proxmox API (опционально): если токен задан, Guest Agent опрашивается
+        # через REST API (infra.proxmox_api), а не через SSH
+        "api_token": api_token,
+        # Имя узла в кластере Proxmox; если не задано — совпадает с именем в config.yaml
+        "api_node": node_conf.get("api_node") or node_name,
+        # Обязателен вместе с api_token (см. проверку выше); без токена не используется
+        "api_verify_ssl": node_conf.get("api_verify_ssl"),
     }
 
@@ -19,22 +19,25 @@
 Дата: Декабрь 2025
 """
 
-import paramiko
 import argparse
+import shlex
 import sys
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable
 
-# Пытаемся импортировать coloredlogs для красивого вывода
-try:
-    import coloredlogs
-except ImportError:
-    coloredlogs = None
+# paramiko нужен здесь только для аннотаций типов: само соединение
+# создает пул в infra.ssh_pool
+if TYPE_CHECKING:
+    import paramiko
 
 # Импорты из наших модулей (Framework)
-from infra.config import load_config, get_node_params
-from infra.ssh_utils import execute_ssh_command, wait_for_ip
+from infra.config import load_config, get_node_params, get_ssh_backend
+from infra.ssh_pool import get_client
+from infra.ssh_utils import execute_ssh_command, execute_ssh_script, wait_for_ip
 # Новый импорт для работы с хранилищем
-from infra.proxmox import prepare_storage, cleanup_ram_vms
+from infra.proxmox import prepare_storage, prepare_storage_steps, cleanup_ram_vms
 
 
 # -----------------------------------------------------------------------------
@@ -43,27 +46,91 @@ from infra.proxmox import prepare_storage, cleanup_ram_vms
 
 logger = logging.getLogger("deploy")
 
+# Логирование настраивается один раз на процесс: повторные deploy_vm
+# (пакетный деплой, цикл в тестах) не переустанавливают обработчики
+_logging_initialized = False
+_logging_lock = threading.Lock()
+
 
 def setup_logging(level: str = "INFO") -> None:
     """
     Настраивает глобальное логирование для всего приложения.
+    Повторные вызовы ничего не делают.
     """
-    log_fmt = "%(asctime)s - %(levelname)s - %(message)s"
-    
-    if coloredlogs:
-        coloredlogs.install(level=level, fmt=log_fmt)
-    else:
-        logging.basicConfig(level=level, format=log_fmt)
-        logging.getLogger().setLevel(level)
-        logger.warning(
-            "Совет: установите 'coloredlogs' для цветного вывода (pip install coloredlogs)"
-        )
+    global _logging_initialized
+    with _logging_lock:
+        if _logging_initialized:
+            return
+        _logging_initialized = True
+
+        log_fmt = "%(asctime)s - %(levelname)s - %(message)s"
+
+        # Цвета нужны только в терминале. В CI и при выводе в файл coloredlogs —
+        # лишний импорт и ANSI-последовательности в логе, поэтому импортируем
+        # его лениво и только для TTY.
+        is_tty = sys.stderr.isatty()
+        coloredlogs = None
+        if is_tty:
+            try:
+                import coloredlogs
+            except ImportError:
+                pass
+
+        if coloredlogs:
+            coloredlogs.install(level=level, fmt=log_fmt)
+        else:
+            logging.basicConfig(level=level, format=log_fmt)
+            logging.getLogger().setLevel(level)
+            if is_tty:
+                logger.warning(
+                    "Совет: установите 'coloredlogs' для цветного вывода (pip install coloredlogs)"
+                )
+
+
+# -----------------------------------------------------------------------------
+# Команды Proxmox (шаблоны)
+# -----------------------------------------------------------------------------
+# Все команды, которые deploy_vm выполняет на хосте, собраны здесь: форма
+# команд видна в одном месте (удобно проверять подстановки в shell).
+# Строковые значения из CLI/конфига подставляются через shlex.quote.
+
+_STATUS_CMD = "qm status {vmid}"
+# Остановка может не удаться (ВМ уже выключена) — это допустимо
+_STOP_CMD = "qm stop {vmid} --skiplock || true"
+_DESTROY_CMD = "qm destroy {vmid} --skiplock --purge"
+# Удаление ВМ, если она существует (проверка на хосте, без отдельного вызова)
+_REPLACE_CMD = (
+    "if qm status {vmid} >/dev/null 2>&1; then "
+    + _STOP_CMD + "; " + _DESTROY_CMD + "; fi"
+)
+_CLONE_CMD = "qm clone {tid} {vmid} --snapname {snap} --storage {storage}"
+_CONFIGURE_CMD = "qm set {vmid} --cpu host --agent 1 --memory {memory}"
+_START_CMD = "qm start {vmid}"
 
 
 # -----------------------------------------------------------------------------
 # Основная логика
 # -----------------------------------------------------------------------------
 
+def confirm_destroy_prompt(vm_id: int) -> bool:
+    """
+    Спрашивает у пользователя разрешение удалить существующую ВМ.
+
+    Без терминала (CI, пакетный запуск) вопрос задать некому: input()
+    либо упадет на EOF, либо зависнет — поэтому сразу отказываем.
+
+    :param vm_id: ID существующей ВМ.
+    :return: True, если пользователь подтвердил удаление.
+    """
+    if not sys.stdin.isatty():
+        logger.error(
+            "stdin is not a TTY: cannot confirm destroying VM %s (use --force)", vm_id
+        )
+        return False
+    choice = input(f"❓ Destroy VM {vm_id} and continue? [y/N]: ")
+    return choice.lower() == "y"
+
+
 def deploy_vm(
     template_id: int,
     snap_name: str,
@@ -73,6 +140,11 @@ def deploy_vm(
     ram_size: int | None = None,
     dry_run: bool = False,
     force: bool = False,
+    config: dict | None = None,
+    confirm_callback: Callable[[int], bool] | None = None,
+    client: "paramiko.SSHClient | None" = None,
+    purge_ram_vms: bool = False,
+    prepare_ram_storage: bool = True,
 ) -> dict:
     """
     Основная функция оркестрации развертывания ВМ.
@@ -80,23 +152,44 @@ def deploy_vm(
     Приоритет параметров:
     - ram_size: CLI --ram-size > nodes.<node>.ram_disk_size_gb > None (tmpfs auto)
     - storage_path: node_params["storage_path"] (обязательный в config.yaml)
+
+    :param config: Уже загруженный конфиг. Если None — загружается из config.yaml.
+                   Позволяет CLI/драйверу прочитать конфиг один раз и передавать дальше.
+    :param confirm_callback: Решает, удалять ли существующую ВМ (получает ее ID),
+                             если force не задан. По умолчанию — вопрос в терминале
+                             (confirm_destroy_prompt). Для пакетного/параллельного
+                             запуска передайте, например, lambda _id: False.
+    :param client: Уже подключенный SSH клиент к целевому узлу (например, из
+                   infra.ssh_pool.acquire), чтобы вызывающий код выполнял
+                   свои команды (cleanup_ram_vms и т.п.) на том же соединении.
+                   Если None — соединение берется из пула по параметрам узла.
+    :param purge_ram_vms: Перед деплоем удалить ВМ, целиком лежащие в RAM-хранилище
+                          узла (cleanup_ram_vms) — замена bash-функции purge_vm_disks.
+    :param prepare_ram_storage: Если False, RAM-хранилище не готовится: вызывающий
+                                код уже подготовил его (deploy_vms — один раз на узел).
     """
-    # 1. Инициализация: конфиг + логирование
-    config = load_config()
-    setup_logging(config.get("logging", {}).get("level", "INFO"))
+    # 1. Инициализация: конфиг (кэшируется в load_config) + логирование (один раз)
+    if config is None:
+        config = load_config()
+    # Секции конфига извлекаем один раз (`or {}` — на случай пустой секции в YAML)
+    logging_cfg = config.get("logging") or {}
+    deploy_cfg = config.get("deploy") or {}
+    setup_logging(logging_cfg.get("level", "INFO"))
 
     # Определяем целевой узел: CLI > config.default_node > "r"
     if not target_node:
         target_node = config.get("default_node", "r")
 
     logger.info(
-        f"🚀 STARTING DEPLOYMENT: Tpl={template_id} Snap={snap_name} "
-        f"NewID={new_vm_id} Node={target_node}"
+        "🚀 STARTING DEPLOYMENT: Tpl=%s Snap=%s NewID=%s Node=%s",
+        template_id, snap_name, new_vm_id, target_node,
     )
 
-    # Получаем параметры для выбранного узла
+    # Получаем параметры для выбранного узла и SSH бэкенд, если соединение
+    # берется из пула (ssh.backend обязателен в config.yaml, хардкод дефолта запрещен)
     try:
         node_params = get_node_params(target_node, config)
+        ssh_backend = get_ssh_backend(config) if client is None and not dry_run else None
     except ValueError as e:
         logger.critical(str(e))
         sys.exit(1)
@@ -112,7 +205,7 @@ def deploy_vm(
 
     # Параметры ВМ (CLI > config.deploy > default)
     if memory is None:
-        memory = config.get("deploy", {}).get("memory", 8192)
+        memory = deploy_cfg.get("memory", 8192)
 
     # Размер RAM-диска: CLI --ram-size > nodes.<node>.ram_disk_size_gb > None (tmpfs auto)
     if ram_size is None:
@@ -122,138 +215,271 @@ def deploy_vm(
         # Если не задан и в узле - None (tmpfs использует 50% RAM автоматически)
         if ram_size is None:
             logger.info(
-                f"ℹ️  ram_disk_size_gb не задан для узла '{target_node}'. "
-                f"tmpfs автоматически использует 50% RAM хоста."
+                "ℹ️  ram_disk_size_gb не задан для узла '%s'. "
+                "tmpfs автоматически использует 50%% RAM хоста.",
+                target_node,
             )
 
-    client: paramiko.SSHClient | None = None
-
     try:
         # ---------------------------------------------------------
         # 1. Установка SSH соединения
         # ---------------------------------------------------------
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-        if not dry_run:
-            logger.info(f"Connecting to {target_node} ({host_ip})...")
-            client.connect(host_ip, username=ssh_user, key_filename=ssh_key)
-            logger.debug("SSH connection established")
+        if client is not None:
+            logger.info("Using provided SSH connection to %s (%s)", target_node, host_ip)
+        elif not dry_run:
+            logger.info("Connecting to %s (%s)...", target_node, host_ip)
+            # Соединение берется из пула: повторный деплой на тот же узел
+            # не платит за TCP + SSH handshake
+            client = get_client(host_ip, ssh_user, ssh_key, backend=ssh_backend)
         else:
-            logger.warning(f"[DRY-RUN] Mock connection to {target_node} ({host_ip})")
+            logger.warning("[DRY-RUN] Mock connection to %s (%s)", target_node, host_ip)
+
+        # Очистка RAM-хранилища от старых ВМ — тем же соединением.
+        # Выполняется до проверки существования: разворачиваемая ВМ с тем же ID
+        # тоже лежит в RAM и может быть удалена здесь — тогда шаги stop/destroy
+        # не нужны (повторный qm destroy упал бы под set -e).
+        if purge_ram_vms:
+            cleanup_ram_vms(client, storage_name=target_storage, dry_run=dry_run)
 
         # ---------------------------------------------------------
         # 2. Проверка конфликтов (Idempotency)
         # ---------------------------------------------------------
-        vm_exists = False
-        try:
-            if not dry_run:
-                execute_ssh_command(
-                    client,
-                    f"qm status {new_vm_id}",
-                    print_output=False,
-                    log_command=False
-                )
-                vm_exists = True
-            else:
-                vm_exists = True
-        except Exception:
-            vm_exists = False
-
-        if vm_exists:
-            if force:
-                logger.warning(
-                    f"⚠️  VM {new_vm_id} exists. FORCE flag set -> Destroying..."
-                )
-                try:
-                    execute_ssh_command(
-                        client,
-                        f"qm stop {new_vm_id} --skiplock",
-                        dry_run=dry_run,
-                        print_output=False,
-                        ignore_errors=True,
-                        log_command=False
-                    )
-                except Exception:
-                    pass
-            else:
-                logger.error(f"❌ VM {new_vm_id} already exists!")
+        # Шаги, которые выполняются на хосте одним SSH вызовом (см. шаг 4)
+        steps: list[tuple[str, str]] = []
+
+        if force:
+            # Спрашивать не нужно: существование ВМ проверяется на хосте
+            # в том же скрипте, без отдельного SSH round-trip на qm status.
+            logger.warning(
+                "⚠️  FORCE flag set -> VM %s will be destroyed if it exists", new_vm_id
+            )
+            steps.append(("replace", _REPLACE_CMD.format(vmid=new_vm_id)))
+        else:
+            # Один вызов qm status: код возврата 0 означает, что ВМ существует.
+            # ignore_errors=True — отсутствие ВМ не является ошибкой.
+            # В dry-run считаем, что ВМ существует (показываем полный сценарий).
+            _, status_rc = execute_ssh_command(
+                client,
+                _STATUS_CMD.format(vmid=new_vm_id),
+                dry_run=dry_run,
+                print_output=False,
+                ignore_errors=True,
+                log_command=False,
+                return_status=True,
+            )
+
+            if status_rc == 0:
+                logger.error("❌ VM %s already exists!", new_vm_id)
                 if not dry_run:
-                    choice = input(
-                        f"❓ Destroy VM {new_vm_id} and continue? [y/N]: "
-                    )
-                    if choice.lower() != "y":
+                    confirm = confirm_callback or confirm_destroy_prompt
+                    if not confirm(new_vm_id):
                         logger.info("🛑 Operation aborted by user.")
                         return {"id": new_vm_id, "ip": None}
-                logger.warning("Stopping VM (User approved)...")
-                try:
-                    execute_ssh_command(
-                        client,
-                        f"qm stop {new_vm_id} --skiplock",
-                        dry_run=dry_run,
-                        print_output=False,
-                        ignore_errors=True,
-                        log_command=False
-                    )
-                    # Уничтожаем ВМ полностью, чтобы освободить диск
-                    execute_ssh_command(
-                        client,
-                        f"qm destroy {new_vm_id} --skiplock --purge",
-                        dry_run=dry_run,
-                        log_command=True
-                    )
-                except Exception:
-                    pass
+                logger.warning("Destroying VM (User approved)...")
+
+                # Останавливаем (ошибка допустима — ВМ может быть уже выключена)
+                # и уничтожаем ВМ полностью, чтобы освободить диск
+                steps.append(("stop", _STOP_CMD.format(vmid=new_vm_id)))
+                steps.append(("destroy", _DESTROY_CMD.format(vmid=new_vm_id)))
 
         # ---------------------------------------------------------
         # 3. Подготовка RAM хранилища (Python instead of Bash)
         # ---------------------------------------------------------
-        prepare_storage(
-            client, 
-            storage_path=ram_mount_path, 
-            ram_size_gb=ram_size,  # Может быть None - тогда tmpfs использует дефолт
-            dry_run=dry_run
-        )
+        # Проверка монтирования выполняется на хосте, поэтому шаги хранилища
+        # входят в общий скрипт (шаг 4) без отдельного SSH вызова
+        if prepare_ram_storage:
+            logger.info("💾 RAM storage at %s will be prepared", ram_mount_path)
+            steps.extend(prepare_storage_steps(
+                storage_path=ram_mount_path,
+                ram_size_gb=ram_size,  # Может быть None - тогда tmpfs использует дефолт
+            ))
 
         # ---------------------------------------------------------
-        # 4. Клонирование ВМ (Clone)
+        # 4. Удаление старой ВМ + Хранилище + Клонирование + Запуск (один SSH вызов)
         # ---------------------------------------------------------
         logger.info(
-            f"📦 Cloning Tpl:{template_id} -> VM:{new_vm_id} "
-            f"to Storage:'{target_storage}'"
+            "📦 Cloning Tpl:%s -> VM:%s to Storage:'%s'",
+            template_id, new_vm_id, target_storage,
         )
 
-        clone_cmd = (
-            f"qm clone {template_id} {new_vm_id} "
-            f"--snapname {snap_name} --storage {target_storage} && "
-            f"qm set {new_vm_id} --cpu host --agent 1 --memory {memory}"
-        )
-        execute_ssh_command(client, clone_cmd, dry_run)
+        steps.append(("clone", _CLONE_CMD.format(
+            tid=template_id,
+            vmid=new_vm_id,
+            snap=shlex.quote(snap_name),
+            storage=shlex.quote(target_storage),
+        )))
+        steps.append(("configure", _CONFIGURE_CMD.format(vmid=new_vm_id, memory=memory)))
+        steps.append(("start", _START_CMD.format(vmid=new_vm_id)))
+
+        # Все шаги — одним exec_command: платим SSH round-trip один раз.
+        # При ошибке исключение содержит имя упавшего шага.
+        # qm clone пишет прогресс-бар в stdout — его строки отфильтровываются.
+        logger.info("▶️  Destroy/Storage/Clone/Start pipeline for VM %s...", new_vm_id)
+        execute_ssh_script(client, steps, dry_run=dry_run)
 
         # ---------------------------------------------------------
-        # 5. Запуск и проверка сети (Start & Network)
+        # 5. Проверка сети (Network)
         # ---------------------------------------------------------
-        logger.info(f"▶️  Starting VM {new_vm_id}...")
-        execute_ssh_command(client, f"qm start {new_vm_id}", dry_run)
+        if node_params.get("api_token") and not dry_run:
+            # Опрос агента через REST API: HTTP keep-alive вместо SSH exec.
+            # Модуль импортируется только для узлов с API токеном.
+            from infra.proxmox_api import get_session, wait_for_ip_api
 
-        ip = wait_for_ip(client, new_vm_id, dry_run=dry_run)
+            session = get_session(
+                host_ip, node_params["api_token"], node_params["api_verify_ssl"]
+            )
+            ip = wait_for_ip_api(session, host_ip, node_params["api_node"], new_vm_id)
+        else:
+            ip = wait_for_ip(client, new_vm_id, dry_run=dry_run)
 
         return {"id": new_vm_id, "ip": ip}
 
     except Exception as e:
-        logger.critical(f"❌ DEPLOYMENT FAILED: {e}")
+        logger.critical("❌ DEPLOYMENT FAILED: %s", e)
         sys.exit(1)
-    finally:
-        if client:
-            client.close()
-            logger.debug("SSH connection closed")
+    # Соединение не закрываем: оно остается в пуле (закрывается при выходе)
+
+
+# Максимум параллельных деплоев: работа упирается в SSH I/O, а не в CPU (GIL не мешает).
+# Деплои на один узел делят одно SSH соединение, а sshd по умолчанию
+# разрешает не более 10 каналов на соединение (MaxSessions) — не поднимать выше.
+MAX_PARALLEL_DEPLOYS = 8
+
+
+def decline_destroy(vm_id: int) -> bool:
+    """
+    confirm_callback для неинтерактивного запуска: существующую ВМ не удаляем.
+    Параллельные потоки не могут по очереди задавать вопросы в терминале.
+    """
+    return False
+
+
+def _spec_node(spec: dict, config: dict) -> str:
+    """Целевой узел спецификации деплоя (как в deploy_vm: target_node > default_node)."""
+    return spec.get("target_node") or config.get("default_node", "r")
+
+
+def _specs_by_node(specs: list[dict], config: dict) -> dict[str, list[dict]]:
+    """Спецификации, сгруппированные по целевому узлу (в порядке specs)."""
+    nodes = {}
+    for spec in specs:
+        nodes.setdefault(_spec_node(spec, config), []).append(spec)
+    return nodes
+
+
+def _prepare_node_storage(node: str, specs: list[dict], config: dict) -> None:
+    """
+    Готовит RAM-хранилище узла (один SSH вызов, см. prepare_storage)
+    для всех спецификаций этого узла сразу.
+
+    Учитываются только спецификации, которым хранилище нужно
+    (prepare_ram_storage, по умолчанию True). Хранилище готовится по-настоящему,
+    если хотя бы одна из них не dry-run; размер — наибольший из запрошенных
+    (ram_size спецификации > nodes.<node>.ram_disk_size_gb, как в deploy_vm).
+
+    :raises ValueError: Узел или ssh.backend отсутствует в config.yaml,
+                        либо узел описан не полностью.
+    """
+    wanted = [spec for spec in specs if spec.get("prepare_ram_storage", True)]
+    if not wanted:
+        return
+
+    node_params = get_node_params(node, config)
+    real = [spec for spec in wanted if not spec.get("dry_run", False)]
+    dry_run = not real
+    node_size = node_params.get("ram_disk_size_gb")
+    sizes = [
+        size
+        for size in (spec.get("ram_size") or node_size for spec in (real or wanted))
+        if size is not None
+    ]
+    # None (ни у одной спецификации, ни у узла) — tmpfs по умолчанию
+    ram_size = max(sizes, default=None)
+
+    client = None
+    if not dry_run:
+        client = get_client(
+            node_params["host"], node_params["user"], node_params["key"],
+            backend=get_ssh_backend(config),
+        )
+    prepare_storage(
+        client, storage_path=node_params["storage_path"], ram_size_gb=ram_size, dry_run=dry_run
+    )
+
+
+def deploy_vms(
+    specs: list[dict],
+    config: dict | None = None,
+    confirm_callback: Callable[[int], bool] = decline_destroy,
+) -> list[dict]:
+    """
+    Разворачивает несколько ВМ параллельно (по потоку на ВМ).
+
+    Каждый элемент specs — это именованные аргументы для deploy_vm
+    (template_id, snap_name, new_vm_id, target_node, ...).
+    Общее время равно времени самого долгого деплоя, а не сумме всех.
+    Деплои на один узел используют общее SSH соединение из пула.
+    Конфиг, логирование и RAM-хранилище каждого узла инициализируются один раз
+    здесь, а не в каждом потоке. Если хранилище узла подготовить не удалось,
+    ВМ этого узла не разворачиваются (ip = None).
+
+    :param specs: Список словарей с аргументами deploy_vm.
+    :param config: Уже загруженный конфиг. Если None — загружается из config.yaml.
+    :param confirm_callback: Решение об удалении существующих ВМ (если в spec
+                             не задан force). По умолчанию — не удалять.
+    :return: Список результатов {"id", "ip"} в порядке specs.
+             Для упавшего деплоя ip = None (ошибка уже записана в лог).
+    """
+    if not specs:
+        return []
+
+    if config is None:
+        config = load_config()
+    setup_logging((config.get("logging") or {}).get("level", "INFO"))
+
+    # RAM-хранилище каждого узла готовится один раз, до запуска потоков.
+    # Параллельные проверки mountpoint на одном хосте могли бы обе увидеть
+    # "не смонтировано", и второй tmpfs перекрыл бы диски, уже склонированные
+    # первым деплоем.
+    ready_nodes = set()
+    for node, node_specs in _specs_by_node(specs, config).items():
+        try:
+            _prepare_node_storage(node, node_specs, config)
+            ready_nodes.add(node)
+        except Exception as e:
+            logger.critical("❌ RAM storage preparation on node %s failed: %s", node, e)
+
+    def _deploy_one(spec: dict) -> dict:
+        if _spec_node(spec, config) not in ready_nodes:
+            return {"id": spec["new_vm_id"], "ip": None}
+        try:
+            # Значения из spec имеют приоритет над общими
+            return deploy_vm(**{
+                "config": config,
+                "confirm_callback": confirm_callback,
+                **spec,
+                "prepare_ram_storage": False,
+            })
+        except SystemExit:
+            # deploy_vm завершает процесс при ошибке (режим CLI).
+            # В пакетном режиме падение одной ВМ не должно прерывать остальные.
+            return {"id": spec["new_vm_id"], "ip": None}
+
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_DEPLOYS, len(specs))) as executor:
+        return list(executor.map(_deploy_one, specs))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Proxmox VM Automated Deployer")
     parser.add_argument("--tmpl-id", required=True, type=int, help="Template VM ID")
     parser.add_argument("--snap", required=True, help="Snapshot name")
-    parser.add_argument("--new-id", required=True, type=int, help="New VM ID")
+    parser.add_argument(
+        "--new-id",
+        required=True,
+        type=int,
+        action="append",
+        help="New VM ID (repeat to deploy several VMs in parallel)",
+    )
     parser.add_argument("--node", help="Target node name (defined in config.yaml)")
     parser.add_argument(
         "--ram-size",
@@ -268,19 +494,56 @@ if __name__ == "__main__":
         action="store_true",
         help="Force destroy existing VM without prompt",
     )
+    parser.add_argument(
+        "--purge-ram",
+        action="store_true",
+        help="Destroy VMs fully located on the node's RAM storage before deploying",
+    )
 
     args = parser.parse_args()
 
+    # Конфиг читаем один раз на точке входа и передаем вниз
+    cfg = load_config()
+
     try:
-        deploy_vm(
-            args.tmpl_id,
-            args.snap,
-            args.new_id,
-            target_node=args.node,
-            ram_size=args.ram_size,
-            dry_run=args.dry_run,
-            force=args.force,
-        )
+        if len(args.new_id) == 1:
+            deploy_vm(
+                args.tmpl_id,
+                args.snap,
+                args.new_id[0],
+                target_node=args.node,
+                ram_size=args.ram_size,
+                dry_run=args.dry_run,
+                force=args.force,
+                config=cfg,
+                purge_ram_vms=args.purge_ram,
+            )
+        else:
+            # Несколько ВМ: деплой и ожидание IP идут параллельно.
+            # Существующие ВМ удаляются только с --force (вопросы в терминале
+            # из параллельных потоков невозможны).
+            if args.purge_ram:
+                logger.error("--purge-ram is supported only for a single --new-id")
+                sys.exit(1)
+            results = deploy_vms(
+                [
+                    {
+                        "template_id": args.tmpl_id,
+                        "snap_name": args.snap,
+                        "new_vm_id": vm_id,
+                        "target_node": args.node,
+                        "ram_size": args.ram_size,
+                        "dry_run": args.dry_run,
+                        "force": args.force,
+                    }
+                    for vm_id in args.new_id
+                ],
+                config=cfg,
+            )
+            for result in results:
+                logger.info("VM %s: IP %s", result["id"], result["ip"])
+            if any(result["ip"] is None for result in results):
+                sys.exit(1)
     except KeyboardInterrupt:
         print("\n🛑 Operation aborted by user.")
         sys.exit(1)
@@ -4,10 +4,16 @@
 """
 
 import logging
-from infra.ssh_utils import execute_ssh_command
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from infra.ssh_utils import execute_ssh_command, execute_ssh_script
 
 logger = logging.getLogger("proxmox")
 
+# Префиксы ключей дисков в конфиге ВМ (scsi, ide, sata, virtio, efidisk)
+_DISK_KEY_PREFIXES = ("scsi", "ide", "sata", "virtio", "efidisk")
+
 def parse_vm_config(config_text: str) -> dict:
     """
     Парсит конфиг ВМ Proxmox в словарь.
@@ -18,19 +24,20 @@ def parse_vm_config(config_text: str) -> dict:
         line = line.strip()
         if not line or line.startswith("#"):
             continue
-        if ":" in line:
-            key, value = line.split(":", 1)
+        key, sep, value = line.partition(":")
+        if sep:
             config[key.strip()] = value.strip()
     return config
 
 def is_disk_key(key: str) -> bool:
     """Проверяет, является ли ключ диском (scsi, ide, sata, virtio, efidisk)."""
-    return any(key.startswith(prefix) for prefix in ["scsi", "ide", "sata", "virtio", "efidisk"])
+    return key.startswith(_DISK_KEY_PREFIXES)
 
 def is_cdrom(value: str) -> bool:
     """Проверяет, является ли значение CD-ROM/ISO."""
     return "media=cdrom" in value or ".iso" in value
 
+
 def check_vm_safety(vm_id: str, config_text: str, target_storage: str) -> bool:
     """
     Проверяет, можно ли безопасно удалить ВМ.
@@ -38,31 +45,96 @@ def check_vm_safety(vm_id: str, config_text: str, target_storage: str) -> bool:
     1. Найдена хотя бы один диск.
     2. ВСЕ жесткие диски (не ISO) должны быть на target_storage.
     3. Значение строки диска должно содержать 'disk', 'size' и 'qcow2' (строгий паттерн).
+
+    Конфиг просматривается одним проходом без регулярных выражений.
+    Проверяется КАЖДАЯ строка диска, включая секции снапшотов ([snapname]):
+    диск снапшота на другом хранилище тоже блокирует удаление (qm destroy
+    --purge удаляет и его). Наличие диска определяется по последнему значению
+    ключа, как в словаре конфига. Проверка останавливается на первом
+    небезопасном диске.
     """
-    config = parse_vm_config(config_text)
-    disk_found = False
-    all_disks_safe = True
-    
-    for key, value in config.items():
-        if is_disk_key(key):
-            if is_cdrom(value):
-                continue
-            
-            disk_found = True
-            
-            # 1. Проверка хранилища (ram:...)
-            if not value.startswith(f"{target_storage}:"):
-                logger.debug(f"VM {vm_id} skipped: Disk '{key}' is on another storage.")
-                all_disks_safe = False
-                break
-            
-            # 2. Строгая проверка паттерна (disk + size + qcow2)
-            if not ("disk" in value and "size" in value and "qcow2" in value):
-                 logger.warning(f"VM {vm_id} skipped: Disk '{key}' matches storage but not strict pattern (disk+size+qcow2).")
-                 all_disks_safe = False
-                 break
-                 
-    return disk_found and all_disks_safe
+    storage_prefix = f"{target_storage}:"
+    disks = {}
+
+    for line in config_text.splitlines():
+        line = line.strip()
+        # Строка, начинающаяся с префикса диска, не пустая и не комментарий
+        if not line.startswith(_DISK_KEY_PREFIXES):
+            continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        key = key.strip()
+        value = value.strip()
+        disks[key] = value
+        if is_cdrom(value):
+            continue
+
+        # 1. Проверка хранилища (ram:...)
+        if not value.startswith(storage_prefix):
+            logger.debug("VM %s skipped: Disk '%s' is on another storage.", vm_id, key)
+            return False
+
+        # 2. Строгая проверка паттерна (disk + size + qcow2)
+        if not ("disk" in value and "size" in value and "qcow2" in value):
+            logger.warning(
+                "VM %s skipped: Disk '%s' matches storage but not strict pattern (disk+size+qcow2).",
+                vm_id, key,
+            )
+            return False
+
+    # Хотя бы один диск (не ISO) в итоговых значениях ключей
+    return any(not is_cdrom(value) for value in disks.values())
+
+
+# Каталог конфигов ВМ текущего узла (pmxcfs)
+VM_CONFIG_DIR = "/etc/pve/qemu-server"
+
+# Все конфиги ВМ одним вызовом: перед содержимым каждого файла — строка-заголовок
+# "===<путь>===" (awk печатает ее на первой строке каждого файла)
+_READ_VM_CONFIGS_CMD = (
+    "awk 'FNR==1{print \"===\" FILENAME \"===\"}1' " + VM_CONFIG_DIR + "/*.conf"
+)
+_CONFIG_HEADER_RE = re.compile(r"^===(.*?)===$", re.MULTILINE)
+
+
+def split_vm_configs(output: str) -> dict[str, str]:
+    """
+    Разбирает вывод _READ_VM_CONFIGS_CMD на конфиги отдельных ВМ.
+
+    :param output: Конкатенация конфигов с заголовками "===<путь>===".
+    :return: Словарь {vm_id: текст конфига}; файлы с нечисловым именем пропускаются.
+    """
+    parts = _CONFIG_HEADER_RE.split(output)
+    # split с группой дает [префикс, путь1, текст1, путь2, текст2, ...]
+    configs = {}
+    for conf_path, config_text in zip(parts[1::2], parts[2::2]):
+        vm_id = conf_path.rsplit("/", 1)[-1].removesuffix(".conf")
+        if vm_id.isdigit():
+            configs[vm_id] = config_text
+    return configs
+
+
+# Ограничение числа одновременных удалений (как MAX_PARALLEL_DEPLOYS в infra.deploy:
+# каждое занимает сессию sshd, по умолчанию MaxSessions = 10)
+MAX_PARALLEL_DESTROYS = 8
+
+
+def _destroy_one(client, vm_id: str, dry_run: bool) -> None:
+    """
+    Останавливает и удаляет ВМ одной SSH командой. Ошибки логируются,
+    чтобы сбой одной ВМ не прерывал удаление остальных.
+
+    :param client: SSH клиент.
+    :param vm_id: ID виртуальной машины.
+    :param dry_run: Режим симуляции.
+    """
+    # Остановка может не удаться (ВМ уже выключена) — это не ошибка
+    command = f"qm stop {vm_id} --skiplock; qm destroy {vm_id} --skiplock --purge"
+    try:
+        execute_ssh_command(client, command, dry_run=dry_run, print_output=False)
+    except Exception as e:
+        logger.error("Failed to purge VM %s: %s", vm_id, e)
 
 
 def cleanup_ram_vms(
@@ -73,76 +145,110 @@ def cleanup_ram_vms(
     """
     Ищет и уничтожает ВМ, ВСЕ диски которых находятся в указанном RAM-хранилище
     и соответствуют строгому паттерну безопасности.
+
+    Все конфиги читаются одним SSH вызовом; отобранные ВМ удаляются параллельно.
     """
-    logger.warning(f"🔥 Scanning for VMs fully on storage '{storage_name}' to purge...")
+    logger.warning("🔥 Scanning for VMs fully on storage '%s' to purge...", storage_name)
     
     try:
-        files_out = execute_ssh_command(
-            client, "ls /etc/pve/qemu-server/*.conf", dry_run=dry_run, print_output=False, ignore_errors=True
+        configs_out = execute_ssh_command(
+            client, _READ_VM_CONFIGS_CMD, dry_run=dry_run, print_output=False,
+            ignore_errors=True, log_command=False,
         )
     except Exception:
-        files_out = ""
+        configs_out = ""
 
-    if not files_out:
+    configs = split_vm_configs(configs_out) if configs_out else {}
+    if not configs:
         logger.info("No VM configs found.")
         return
 
-    config_files = files_out.strip().splitlines()
-    
-    for conf_path in config_files:
+    # Проверка безопасности выполняется локально, без SSH
+    to_destroy = []
+    for vm_id, config_text in configs.items():
         try:
-            vm_id = conf_path.split("/")[-1].replace(".conf", "")
-            if not vm_id.isdigit():
-                continue
-            
-            config_text = execute_ssh_command(client, f"cat {conf_path}", dry_run=dry_run, print_output=False, log_command=False)
-            
-            if not config_text:
-                continue
-
             if check_vm_safety(vm_id, config_text, storage_name):
-                logger.warning(f"⚠️  VM {vm_id} is fully on {storage_name} and matches safety pattern. Destroying...")
-                execute_ssh_command(client, f"qm stop {vm_id} --skiplock", dry_run=dry_run, ignore_errors=True, log_command=True)
-                execute_ssh_command(client, f"qm destroy {vm_id} --skiplock --purge", dry_run=dry_run, log_command=True)
-            
+                logger.warning(
+                    "⚠️  VM %s is fully on %s and matches safety pattern. Destroying...",
+                    vm_id, storage_name,
+                )
+                to_destroy.append(vm_id)
         except Exception as e:
-            logger.error(f"Failed to analyze/purge VM {conf_path}: {e}")
+            logger.error("Failed to analyze VM %s: %s", vm_id, e)
+
+    if not to_destroy:
+        return
+
+    # qm destroy занимает секунды, поэтому ВМ удаляются параллельно. Потоки
+    # используют один клиент из пула: каждый открывает свой канал в общем транспорте.
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_DESTROYS, len(to_destroy))) as executor:
+        list(executor.map(lambda vm_id: _destroy_one(client, vm_id, dry_run), to_destroy))
+
+
+def prepare_storage_steps(
+    storage_path: str,
+    ram_size_gb: int | None = 32,
+    force_remount: bool = False,
+) -> list[tuple[str, str]]:
+    """
+    Возвращает шаги подготовки tmpfs хранилища для execute_ssh_script.
+
+    Проверка "уже смонтировано?" выполняется на стороне хоста (mountpoint -q),
+    поэтому шаги можно склеить с другими командами в один SSH вызов
+    (см. deploy_vm) — без отдельного round-trip на проверку.
+
+    :param storage_path: Точка монтирования RAM-диска.
+    :param ram_size_gb: Размер tmpfs в ГБ. None — дефолт tmpfs (50% RAM хоста).
+    :param force_remount: Перемонтировать, даже если уже смонтировано (данные теряются!).
+    :return: Список пар (имя_шага, команда). Шаг "mount" печатает MOUNTED
+             или ALREADY_MOUNTED.
+    """
+    size_opt = f"-o size={ram_size_gb}G " if ram_size_gb else ""
+    # Команды разделены ';', а не '&&': под `set -e` ошибка внутри '&&'-цепочки
+    # (кроме последней команды) НЕ прерывает скрипт, и сбой mount прошел бы молча
+    mount_cmd = (
+        f"mkdir -p {storage_path}; "
+        f"mount -t tmpfs {size_opt}tmpfs {storage_path}; echo MOUNTED"
+    )
+
+    steps = []
+    if force_remount:
+        steps.append(("umount", f"umount {storage_path} || true"))
+        steps.append(("mount", mount_cmd))
+    else:
+        # Уже смонтированный tmpfs не трогаем: перемонтирование уничтожит диски ВМ
+        steps.append((
+            "mount",
+            f"if mountpoint -q {storage_path}; then echo ALREADY_MOUNTED; "
+            f"else {mount_cmd}; fi",
+        ))
+    steps.append(("storage_dirs", f"mkdir -p {storage_path}/{{images,snippets,iso,dump}}"))
+    return steps
 
 
 def prepare_storage(
     client, 
     storage_path: str, 
-    ram_size_gb: int = 32, 
+    ram_size_gb: int | None = 32, 
     dry_run: bool = False,
     force_remount: bool = False
 ) -> None:
     """
-    Подготавливает tmpfs хранилище.
+    Подготавливает tmpfs хранилище (одним SSH вызовом).
     """
-    logger.info(f"💾 Checking RAM storage at {storage_path}...")
-
-    is_mounted = False
-    if not dry_run:
-        check_cmd = f"mount | grep ' {storage_path} ' || true"
-        out = execute_ssh_command(client, check_cmd, print_output=False, log_command=False)
-        if out.strip():
-            is_mounted = True
-    else:
-        is_mounted = False
-
-    if is_mounted and not force_remount:
-        logger.info(f"✅ Storage {storage_path} is already mounted. Skipping remount (safe).")
-        execute_ssh_command(client, f"mkdir -p {storage_path}/{{images,snippets,iso,dump}}", dry_run=dry_run, log_command=False)
-        return
+    logger.info("💾 Checking RAM storage at %s...", storage_path)
 
     if force_remount:
-        logger.warning(f"♻️  Force remount requested! Data in {storage_path} will be lost.")
-        execute_ssh_command(client, f"umount {storage_path} || true", dry_run=dry_run)
+        logger.warning("♻️  Force remount requested! Data in %s will be lost.", storage_path)
 
-    logger.info(f"Mounting tmpfs ({ram_size_gb}GB) -> {storage_path}")
-    execute_ssh_command(client, f"mkdir -p {storage_path}", dry_run=dry_run)
-    execute_ssh_command(client, f"mount -t tmpfs -o size={ram_size_gb}G tmpfs {storage_path}", dry_run=dry_run)
-    execute_ssh_command(client, f"mkdir -p {storage_path}/{{images,snippets,iso,dump}}", dry_run=dry_run)
-    
-    logger.info("✅ RAM storage ready.")
+    result = execute_ssh_script(
+        client,
+        prepare_storage_steps(storage_path, ram_size_gb, force_remount),
+        dry_run=dry_run,
+        print_output=False,
+    )
 
+    if result.get("mount") == "ALREADY_MOUNTED":
+        logger.info("✅ Storage %s is already mounted. Skipping remount (safe).", storage_path)
+    else:
+        logger.info("✅ RAM storage ready.")
@@ -0,0 +1,104 @@
+"""
+Клиент Proxmox REST API.
+
+Используется вместо SSH там, где API дешевле: опрос QEMU Guest Agent
+выполняется HTTP запросами по одному keep-alive соединению (requests.Session),
+без запуска процесса `qm` на хосте на каждую попытку.
+
+Включается для узла параметром nodes.<node>.api_token в config.yaml
+(токен Proxmox вида "user@realm!tokenid=uuid").
+"""
+
+import logging
+import threading
+import time
+
+import requests
+
+from infra.ssh_utils import (
+    IP_POLL_BACKOFF,
+    IP_POLL_INITIAL_DELAY,
+    IP_POLL_MAX_DELAY,
+    find_lan_ip,
+)
+
+logger = logging.getLogger("proxmox_api")
+
+# Порт веб-интерфейса и API Proxmox VE
+API_PORT = 8006
+# Таймаут одного HTTP запроса (секунды): подключение, чтение
+API_REQUEST_TIMEOUT = (5, 15)
+
+# Сессии переиспользуются между деплоями (как SSH соединения в infra.ssh_pool):
+# TLS handshake выполняется один раз на узел
+_sessions: dict[tuple[str, str, bool], requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(host: str, api_token: str, verify_ssl: bool = True) -> requests.Session:
+    """
+    Возвращает HTTP сессию к API узла (создает при первом обращении).
+
+    :param host: Адрес узла Proxmox.
+    :param api_token: API токен ("user@realm!tokenid=uuid").
+    :param verify_ssl: Проверять ли TLS сертификат (у Proxmox по умолчанию самоподписанный).
+    :return: requests.Session с заголовком авторизации.
+    """
+    key = (host, api_token, verify_ssl)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.headers["Authorization"] = f"PVEAPIToken={api_token}"
+            session.verify = verify_ssl
+            _sessions[key] = session
+        return session
+
+
+def wait_for_ip_api(
+    session: requests.Session,
+    host: str,
+    node: str,
+    vm_id: int,
+    timeout: int = 60,
+) -> str | None:
+    """
+    Ожидает появления IP-адреса у ВМ через Proxmox API (Guest Agent).
+
+    Пока агент не запущен, API отвечает ошибкой (HTTP 500) — повторяем запрос
+    с экспоненциальной задержкой (0.5с -> 3с) до истечения таймаута.
+
+    :param session: Сессия из get_session.
+    :param host: Адрес узла Proxmox.
+    :param node: Имя узла в кластере Proxmox (как в веб-интерфейсе).
+    :param vm_id: ID виртуальной машины.
+    :param timeout: Максимальное время ожидания в секундах.
+    :return: IP адрес (str) или None, если не найден.
+    """
+    url = (
+        f"https://{host}:{API_PORT}/api2/json/nodes/{node}"
+        f"/qemu/{vm_id}/agent/network-get-interfaces"
+    )
+    logger.info("⏳ Waiting for IP address via API (Max %ss)...", timeout)
+    deadline = time.monotonic() + timeout
+    delay = IP_POLL_INITIAL_DELAY
+
+    while time.monotonic() < deadline:
+        try:
+            resp = session.get(url, timeout=API_REQUEST_TIMEOUT)
+            if resp.ok:
+                ip = find_lan_ip(resp.json()["data"]["result"])
+                if ip:
+                    logger.info("✅ IP FOUND: %s", ip)
+                    return ip
+            else:
+                logger.debug("Guest agent not ready (HTTP %s)", resp.status_code)
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            # Сеть/TLS или неожиданная форма ответа — пробуем снова
+            logger.debug("API poll failed: %s", e)
+
+        time.sleep(delay)
+        delay = min(IP_POLL_MAX_DELAY, delay * IP_POLL_BACKOFF)
+
+    logger.warning("⚠️  Timeout waiting for IP. Guest Agent might not be running.")
+    return None
@@ -0,0 +1,217 @@
+"""
+Альтернативный SSH бэкенд на ssh2-python (C-биндинг libssh2).
+
+paramiko реализует шифрование и разбор протокола на Python, и при частом
+выполнении команд (опрос, пакетный деплой) именно это ограничивает скорость.
+libssh2 делает ту же работу в C.
+
+Клиент повторяет ту часть интерфейса paramiko.SSHClient, которой пользуется
+фреймворк (get_transport().is_active(), close()), а команды выполняет сам:
+execute_ssh_command вызывает run_command вместо работы с paramiko.Channel.
+Включается в config.yaml: ssh.backend: "ssh2". Пакет ssh2-python опционален.
+"""
+
+import logging
+import select
+import threading
+
+import paramiko
+
+from infra.ssh_pool import SSH_PORT, _open_socket
+from infra.ssh_utils import _RECV_CHUNK, _SELECT_TIMEOUT, _emit_lines
+
+try:
+    from ssh2.error_codes import LIBSSH2_ERROR_EAGAIN
+    from ssh2.exceptions import SSH2Error
+    from ssh2.session import (
+        LIBSSH2_FLAG_COMPRESS,
+        LIBSSH2_SESSION_BLOCK_INBOUND,
+        LIBSSH2_SESSION_BLOCK_OUTBOUND,
+        Session,
+    )
+except ImportError:
+    Session = None
+
+logger = logging.getLogger("ssh_backend")
+
+# Таймаут ожидания сокета (секунды), пока на соединении выполняется несколько
+# команд: данные канала могли быть уже прочитаны вызовом из другого потока
+_SHARED_SELECT_TIMEOUT = 0.01
+
+
+class Ssh2Client:
+    """
+    SSH соединение на libssh2 с интерфейсом, совместимым с пулом (infra.ssh_pool)
+    и execute_ssh_command.
+
+    Сессия libssh2 не потокобезопасна, поэтому под блокировкой выполняются
+    только отдельные вызовы libssh2, а ожидание сокета — вне ее: команды
+    из разных потоков идут параллельно, каждая в своем канале (долгое
+    ожидание IP не задерживает другие деплои на том же узле).
+    Ошибки libssh2 пробрасываются как paramiko.SSHException — вызывающий код
+    обрабатывает их так же, как ошибки транспорта paramiko.
+    """
+
+    def __init__(self, host: str, user: str, key: str, port: int = SSH_PORT):
+        """
+        Устанавливает соединение и аутентифицируется ключом.
+
+        :param host: Адрес узла.
+        :param user: Имя пользователя SSH.
+        :param key: Путь к приватному ключу.
+        :param port: Порт SSH.
+        :raises ImportError: Если ssh2-python не установлен.
+        :raises paramiko.SSHException: Если handshake или аутентификация не удались.
+        """
+        if Session is None:
+            raise ImportError(
+                "ssh.backend 'ssh2' requires ssh2-python (pip install ssh2-python)"
+            )
+        self._lock = threading.Lock()
+        # Число команд, выполняющихся сейчас на соединении (см. _wait_socket)
+        self._commands = 0
+        self._sock = _open_socket(host, port)
+        self._session = Session()
+        try:
+            # Сжатие, как и у paramiko-клиентов пула (текстовый вывод qm и JSON)
+            self._session.flag(LIBSSH2_FLAG_COMPRESS)
+            self._session.handshake(self._sock)
+            self._session.userauth_publickey_fromfile(user, key)
+        except SSH2Error as e:
+            self._sock.close()
+            raise paramiko.SSHException(f"ssh2 connect to {host} failed: {e!r}") from e
+        except BaseException:
+            self._sock.close()
+            raise
+        # Неблокирующий режим: stdout и stderr читаются попеременно (без deadlock),
+        # ожидание данных — через select по сокету
+        self._session.set_blocking(False)
+        self._active = True
+
+    def get_transport(self) -> "Ssh2Client":
+        """Совместимость с paramiko: пул проверяет get_transport().is_active()."""
+        return self
+
+    def is_active(self) -> bool:
+        """True, пока соединение не закрыто и не сломано ошибкой."""
+        return self._active
+
+    def close(self) -> None:
+        """Закрывает сессию и сокет."""
+        self._active = False
+        try:
+            with self._lock:
+                self._session.set_blocking(True)
+                self._session.disconnect()
+        except SSH2Error:
+            pass
+        finally:
+            self._sock.close()
+
+    def _wait_socket(self, directions: int) -> None:
+        """
+        Ждет, пока сокет станет готов в направлении, нужном libssh2.
+        Если libssh2 направление не сообщает, ждем входящих данных.
+
+        Вызывается без блокировки. Пока на соединении выполняются и другие
+        команды, их вызовы libssh2 могут забрать из сокета и данные нашего
+        канала — тогда сокет не станет готов, поэтому ждем недолго.
+
+        :param directions: block_directions() сессии, прочитанный под блокировкой.
+        """
+        inbound = not directions or directions & LIBSSH2_SESSION_BLOCK_INBOUND
+        rlist = [self._sock] if inbound else []
+        wlist = [self._sock] if directions & LIBSSH2_SESSION_BLOCK_OUTBOUND else []
+        timeout = _SELECT_TIMEOUT if self._commands <= 1 else _SHARED_SELECT_TIMEOUT
+        select.select(rlist, wlist, [], timeout)
+
+    def _call(self, func, *args):
+        """Вызывает функцию libssh2, повторяя ее, пока она возвращает EAGAIN."""
+        while True:
+            with self._lock:
+                result = func(*args)
+                if result != LIBSSH2_ERROR_EAGAIN:
+                    return result
+                directions = self._session.block_directions()
+            self._wait_socket(directions)
+
+    def run_command(self, command: str, on_line=None) -> tuple[bytes, bytes, int]:
+        """
+        Выполняет команду и вычитывает stdout и stderr одновременно.
+        Может вызываться из нескольких потоков на одном соединении.
+
+        :param command: Строка команды.
+        :param on_line: Обработчик полных строк stdout (как в _drain_channel).
+        :return: Кортеж (stdout, stderr, exit_status).
+        :raises paramiko.SSHException: При ошибке libssh2 (соединение помечается мертвым).
+        """
+        with self._lock:
+            self._commands += 1
+        try:
+            return self._run(command, on_line)
+        except SSH2Error as e:
+            self._active = False
+            raise paramiko.SSHException(f"ssh2 command failed: {e!r}") from e
+        except paramiko.SSHException:
+            # Код ошибки libssh2 (не исключение): сессия так же непригодна
+            self._active = False
+            raise
+        finally:
+            with self._lock:
+                self._commands -= 1
+
+    def _read_available(
+        self, chan, out_buf: bytearray, err_buf: bytearray
+    ) -> tuple[int, int, bool, int]:
+        """
+        Под блокировкой вычитывает из канала все, что уже доступно.
+
+        :return: Кортеж (код чтения stdout, код чтения stderr, chan.eof(),
+                 block_directions() сессии).
+        """
+        with self._lock:
+            size, data = chan.read(_RECV_CHUNK)
+            while size > 0:
+                out_buf += data
+                size, data = chan.read(_RECV_CHUNK)
+            err_size, data = chan.read_stderr(_RECV_CHUNK)
+            while err_size > 0:
+                err_buf += data
+                err_size, data = chan.read_stderr(_RECV_CHUNK)
+            return size, err_size, chan.eof(), self._session.block_directions()
+
+    def _run(self, command: str, on_line) -> tuple[bytes, bytes, int]:
+        chan = self._call(self._session.open_session)
+        if isinstance(chan, int):
+            raise paramiko.SSHException(f"ssh2 open_session failed: {chan}")
+        self._call(chan.execute, command)
+
+        out_buf = bytearray()
+        err_buf = bytearray()
+        emitted = 0
+
+        while True:
+            received = len(out_buf) + len(err_buf)
+            size, err_size, eof, directions = self._read_available(chan, out_buf, err_buf)
+            if on_line is not None:
+                emitted = _emit_lines(out_buf, emitted, on_line)
+
+            for rc in (size, err_size):
+                if rc < 0 and rc != LIBSSH2_ERROR_EAGAIN:
+                    raise paramiko.SSHException(f"ssh2 read failed: {rc}")
+            if eof:
+                break
+            # Ни один поток не дал данных за проход — ждем сокет. Ждать только
+            # при EAGAIN на обоих нельзя: stdout может вернуть 0 (EOF потока)
+            # раньше chan.eof(), и цикл крутился бы вхолостую
+            if len(out_buf) + len(err_buf) == received:
+                self._wait_socket(directions)
+
+        if on_line is not None and emitted < len(out_buf):
+            on_line(bytes(out_buf[emitted:]))
+
+        # exit status доступен после закрытия канала
+        self._call(chan.close)
+        self._call(chan.wait_closed)
+        with self._lock:
+            return bytes(out_buf), bytes(err_buf), chan.get_exit_status()
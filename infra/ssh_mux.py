@@ -0,0 +1,183 @@
+"""
+SSH бэкенд на системном клиенте OpenSSH с мультиплексированием (ControlMaster).
+
+Первое подключение поднимает фоновое мастер-соединение (TCP + handshake +
+аутентификация), а каждая команда — это короткий процесс `ssh`, который
+открывает канал в уже установленной сессии через локальный сокет
+(ControlPath). Мастер, запущенный клиентом, останавливается при закрытии
+клиента (пул закрывает соединения при выходе); живой мастер другого
+процесса переиспользуется. SSH_CONTROL_PERSIST ограничивает жизнь мастера,
+если процесс-владелец завершился аварийно.
+
+Клиент повторяет ту часть интерфейса paramiko.SSHClient, которой пользуется
+фреймворк (get_transport().is_active(), close()), а команды выполняет сам
+(run_command). Включается в config.yaml: ssh.backend: "openssh".
+Требуется клиент OpenSSH (`ssh`) в PATH.
+"""
+
+import logging
+import os
+import select
+import subprocess
+import tempfile
+
+from infra.ssh_pool import SSH_CONNECT_TIMEOUT, SSH_KEEPALIVE_INTERVAL, SSH_PORT
+from infra.ssh_utils import _RECV_CHUNK, _emit_lines
+
+logger = logging.getLogger("ssh_mux")
+
+# Сокет мастер-соединения: %C — хэш (локальный хост, узел, порт, пользователь)
+SSH_CONTROL_PATH = "~/.ssh/cpro-mux-%C"
+# Сколько мастер-соединение живет после последней команды (секунды), если его
+# не остановил владелец (аварийное завершение процесса)
+SSH_CONTROL_PERSIST = 600
+
+# Код возврата ssh при ошибке самого SSH (а не удаленной команды)
+_SSH_ERROR_STATUS = 255
+# Начало stderr, по которому код 255 отличается от кода удаленной команды
+_SSH_ERROR_PREFIXES = (b"ssh:", b"Connection closed", b"kex_exchange_identification")
+
+
+def _ssh_error(message: str) -> Exception:
+    """Ошибка транспорта в том же виде, что у остальных бэкендов."""
+    import paramiko
+
+    return paramiko.SSHException(message)
+
+
+class OpenSshClient:
+    """
+    SSH соединение через мультиплексированный клиент OpenSSH с интерфейсом,
+    совместимым с пулом (infra.ssh_pool) и execute_ssh_command.
+
+    Каждая команда выполняется отдельным процессом, поэтому команды на одном
+    клиенте могут идти параллельно (каналы мультиплексирует мастер).
+    Ошибки SSH пробрасываются как paramiko.SSHException.
+    """
+
+    def __init__(self, host: str, user: str, key: str, port: int = SSH_PORT):
+        """
+        Поднимает мастер-соединение (если оно еще не запущено).
+
+        :param host: Адрес узла.
+        :param user: Имя пользователя SSH.
+        :param key: Путь к приватному ключу.
+        :param port: Порт SSH.
+        :raises paramiko.SSHException: Если мастер-соединение не установлено.
+        """
+        self._host = host
+        self._target = f"{user}@{host}"
+        # Ключ задан явно (как и у paramiko): без агента и перебора ~/.ssh.
+        # BatchMode — никаких интерактивных вопросов (пароль, host key).
+        self._base_cmd = [
+            "ssh",
+            "-i", key,
+            "-p", str(port),
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={SSH_CONTROL_PATH}",
+            "-o", f"ControlPersist={SSH_CONTROL_PERSIST}",
+            "-o", "BatchMode=yes",
+            "-o", "IdentitiesOnly=yes",
+            "-o", "StrictHostKeyChecking=accept-new",
+            "-o", f"ConnectTimeout={SSH_CONNECT_TIMEOUT}",
+            "-o", f"ServerAliveInterval={SSH_KEEPALIVE_INTERVAL}",
+            "-o", "Compression=yes",
+        ]
+        # Каталог сокета должен существовать
+        os.makedirs(os.path.expanduser("~/.ssh"), mode=0o700, exist_ok=True)
+        # True, если мастер запущен этим клиентом (тогда close() его остановит)
+        self._owns_master = False
+        self._ensure_master()
+        self._active = True
+
+    def _control(self, command: str) -> int:
+        """Выполняет управляющую команду мастера (ssh -O check/exit), возвращает код."""
+        return subprocess.run(
+            self._base_cmd + ["-O", command, self._target],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ).returncode
+
+    def _ensure_master(self) -> None:
+        """Запускает фоновое мастер-соединение, если живого еще нет."""
+        if self._control("check") == 0:
+            logger.debug("Reusing OpenSSH master connection to %s", self._host)
+            return
+
+        # -M -N -f: мастер без команды, уходит в фон после аутентификации.
+        # Фоновый процесс наследует stdout/stderr: с каналами (capture_output)
+        # run() ждал бы их закрытия, то есть завершения мастера. Поэтому stdout
+        # отбрасывается, а stderr (текст ошибки) пишется во временный файл.
+        with tempfile.TemporaryFile() as err_file:
+            master = subprocess.run(
+                self._base_cmd + ["-M", "-N", "-f", self._target],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=err_file,
+            )
+            if master.returncode != 0:
+                err_file.seek(0)
+                raise _ssh_error(
+                    f"OpenSSH master connection to {self._host} failed: "
+                    f"{err_file.read().decode(errors='replace').strip()}"
+                )
+        self._owns_master = True
+
+    def get_transport(self) -> "OpenSshClient":
+        """Совместимость с paramiko: пул проверяет get_transport().is_active()."""
+        return self
+
+    def is_active(self) -> bool:
+        """
+        True, пока клиент не закрыт и мастер-соединение живо (ssh -O check).
+        Упавший мастер делает клиент неактивным — пул переподключится.
+        """
+        return self._active and self._control("check") == 0
+
+    def close(self) -> None:
+        """
+        Закрывает клиент. Мастер-соединение, запущенное этим клиентом,
+        останавливается (ssh -O exit); чужой мастер не трогаем.
+        """
+        if self._active and self._owns_master:
+            self._control("exit")
+        self._active = False
+
+    def run_command(self, command: str, on_line=None) -> tuple[bytes, bytes, int]:
+        """
+        Выполняет команду и вычитывает stdout и stderr одновременно.
+
+        :param command: Строка команды.
+        :param on_line: Обработчик полных строк stdout (как в _drain_channel).
+        :return: Кортеж (stdout, stderr, exit_status).
+        :raises paramiko.SSHException: При ошибке SSH (код 255 от самого ssh).
+        """
+        proc = subprocess.Popen(
+            self._base_cmd + [self._target, command],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        out_buf = bytearray()
+        err_buf = bytearray()
+        emitted = 0
+        buffers = {proc.stdout.fileno(): out_buf, proc.stderr.fileno(): err_buf}
+
+        try:
+            # Читаем оба потока по мере поступления, пока оба не закроются
+            while buffers:
+                ready, _, _ = select.select(list(buffers), [], [])
+                for fd in ready:
+                    data = os.read(fd, _RECV_CHUNK)
+                    if data:
+                        buffers[fd] += data
+                    else:
+                        del buffers[fd]
+                if on_line is not None:
+                    emitted = _emit_lines(out_buf, emitted, on_line)
+            exit_status = proc.wait()
+        finally:
+            proc.stdout.close()
+            proc.stderr.close()
+
+        if on_line is not None and emitted < len(out_buf):
+            on_line(bytes(out_buf[emitted:]))
+
+        if exit_status == _SSH_ERROR_STATUS and err_buf.startswith(_SSH_ERROR_PREFIXES):
+            raise _ssh_error(f"ssh to {self._host} failed: {err_buf.decode(errors='replace').strip()}")
+        return bytes(out_buf), bytes(err_buf), exit_status
@@ -0,0 +1,216 @@
+"""
+Пул SSH соединений к узлам Proxmox.
+
+TCP + SSH handshake (обмен ключами, аутентификация) стоит сотни миллисекунд.
+Пул держит одно соединение на (host, user, key) на весь процесс: повторные
+деплои на тот же узел переиспользуют уже открытый транспорт.
+"""
+
+import atexit
+import contextlib
+import logging
+import socket
+import threading
+from typing import TYPE_CHECKING
+
+# paramiko (вместе с cryptography) импортируется только при первом подключении:
+# --help, --dry-run и импорт модулей фреймворка обходятся без него
+if TYPE_CHECKING:
+    import paramiko
+
+logger = logging.getLogger("ssh_pool")
+
+# Ключ пула включает путь к ключу и бэкенд: разные ключи к одному узлу — разные сессии
+_ssh_pool: "dict[tuple[str, str, str, str], paramiko.SSHClient]" = {}
+_ssh_pool_lock = threading.Lock()
+# Блокировки подключения по ключу пула: handshake выполняется вне общей
+# блокировки, поэтому узлы подключаются параллельно, а к одному узлу
+# одновременные вызовы не открывают лишних соединений
+_connect_locks: "dict[tuple[str, str, str, str], threading.Lock]" = {}
+
+# Интервал keepalive (секунды): соединение в пуле не должно рваться
+# по таймауту простоя между деплоями и во время долгого ожидания IP
+SSH_KEEPALIVE_INTERVAL = 15
+
+SSH_PORT = 22
+
+# Доступные SSH бэкенды (config.yaml: ssh.backend):
+# - paramiko — по умолчанию;
+# - ssh2 — libssh2 через ssh2-python (infra.ssh_backend), быстрее на частых командах;
+# - openssh — клиент OpenSSH с ControlMaster (infra.ssh_mux): команды идут
+#   через мастер-соединение; живой мастер параллельного запуска переиспользуется.
+SSH_BACKENDS = ("paramiko", "ssh2", "openssh")
+
+# Устаревшие и медленные алгоритмы исключаем из согласования при handshake:
+# список предложений короче, а ключи DSA и KEX/MAC на SHA-1 не выбираются.
+# Рекомендуемый тип ключа — ed25519 (самая быстрая подпись и проверка).
+# diffie-hellman-group-exchange-* требует лишнего обмена (запрос группы) и
+# модульного возведения в степень с большим модулем — медленнее curve25519/ECDH.
+SSH_DISABLED_ALGORITHMS = {
+    "pubkeys": ["ssh-dss", "ssh-rsa"],
+    "kex": [
+        "diffie-hellman-group-exchange-sha1",
+        "diffie-hellman-group-exchange-sha256",
+        "diffie-hellman-group1-sha1",
+    ],
+    "macs": ["hmac-sha1", "hmac-md5"],
+}
+# Таймауты (секунды): TCP подключение, баннер сервера, аутентификация.
+# Недоступный узел дает ошибку сразу, а не через минуты ожидания.
+SSH_CONNECT_TIMEOUT = 5
+SSH_BANNER_TIMEOUT = 5
+SSH_AUTH_TIMEOUT = 5
+
+
+def _open_socket(host: str, port: int = SSH_PORT) -> socket.socket:
+    """
+    Открывает TCP сокет к узлу с настройками для SSH трафика.
+
+    TCP_NODELAY отключает алгоритм Нейгла: короткие пакеты SSH (команда,
+    window adjust, keepalive) уходят сразу, без ожидания ACK предыдущих.
+    Размеры буферов не задаются: явный SO_SNDBUF/SO_RCVBUF отключает
+    автонастройку буферов TCP в Linux.
+
+    :param host: Адрес узла.
+    :param port: Порт SSH.
+    :return: Подключенный сокет.
+    """
+    sock = socket.create_connection((host, port), timeout=SSH_CONNECT_TIMEOUT)
+    try:
+        # Таймаут нужен только на подключение: дальше сокетом управляет бэкенд
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def _connect_paramiko(host: str, user: str, key: str) -> "paramiko.SSHClient":
+    """Устанавливает SSH соединение через paramiko (бэкенд по умолчанию)."""
+    import paramiko
+
+    client = paramiko.SSHClient()
+    # Известный ключ узла из ~/.ssh/known_hosts сужает согласование до его типа
+    # и проверяется; неизвестный узел (первое подключение) принимается.
+    client.load_system_host_keys()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    # compress=True: сжатие (zlib) согласуется при handshake — JSON от
+    # Guest Agent и текстовый вывод qm хорошо сжимаются.
+    # sock: сокет с TCP_NODELAY (см. _open_socket) вместо сокета по умолчанию.
+    # Ключ задан явно в config.yaml — не перебираем ~/.ssh и ssh-agent.
+    sock = _open_socket(host)
+    try:
+        client.connect(
+            host,
+            username=user,
+            key_filename=key,
+            compress=True,
+            sock=sock,
+            look_for_keys=False,
+            allow_agent=False,
+            disabled_algorithms=SSH_DISABLED_ALGORITHMS,
+            banner_timeout=SSH_BANNER_TIMEOUT,
+            auth_timeout=SSH_AUTH_TIMEOUT,
+        )
+    except BaseException:
+        # Ошибка handshake/аутентификации: сокет передан извне, paramiko его не закроет
+        client.close()
+        sock.close()
+        raise
+    client.get_transport().set_keepalive(SSH_KEEPALIVE_INTERVAL)
+    return client
+
+
+def _connect(host: str, user: str, key: str, backend: str):
+    """
+    Создает соединение выбранным бэкендом.
+
+    :raises ValueError: Неизвестный бэкенд.
+    """
+    if backend == "paramiko":
+        return _connect_paramiko(host, user, key)
+    if backend == "ssh2":
+        # Импорт только при выборе бэкенда: ssh2-python — опциональная зависимость
+        from infra.ssh_backend import Ssh2Client
+        return Ssh2Client(host, user, key)
+    if backend == "openssh":
+        from infra.ssh_mux import OpenSshClient
+        return OpenSshClient(host, user, key)
+    raise ValueError(f"Unknown SSH backend '{backend}'. Available: {list(SSH_BACKENDS)}")
+
+
+def get_client(host: str, user: str, key: str, backend: str = "paramiko"):
+    """
+    Возвращает подключенный SSH клиент из пула (или создает новый).
+
+    Если соединение в пуле "умерло" (транспорт неактивен), оно закрывается
+    и устанавливается заново. Закрывать клиент вызывающему коду не нужно —
+    все соединения закрываются при завершении интерпретатора (atexit).
+
+    :param host: Адрес узла Proxmox.
+    :param user: Имя пользователя SSH.
+    :param key: Путь к приватному ключу.
+    :param backend: SSH бэкенд из SSH_BACKENDS (config.yaml: ssh.backend).
+    :return: Подключенный клиент (paramiko.SSHClient, infra.ssh_backend.Ssh2Client
+             или infra.ssh_mux.OpenSshClient).
+    """
+    pool_key = (host, user, key, backend)
+    with _ssh_pool_lock:
+        connect_lock = _connect_locks.setdefault(pool_key, threading.Lock())
+
+    # Общая блокировка держится только на время работы со словарями:
+    # handshake (сотни миллисекунд) идет под блокировкой своего ключа
+    with connect_lock:
+        with _ssh_pool_lock:
+            client = _ssh_pool.get(pool_key)
+        if client is not None:
+            transport = client.get_transport()
+            if transport is not None and transport.is_active():
+                return client
+            logger.debug("SSH connection to %s is dead. Reconnecting...", host)
+            client.close()
+
+        client = _connect(host, user, key, backend)
+        logger.debug("SSH connection to %s established (%s)", host, backend)
+        with _ssh_pool_lock:
+            _ssh_pool[pool_key] = client
+        return client
+
+
+@contextlib.contextmanager
+def acquire(host: str, user: str, key: str, backend: str = "paramiko"):
+    """
+    Контекстный менеджер над get_client: выдает соединение из пула.
+
+    Соединение общее (каналы мультиплексируются поверх одного транспорта),
+    поэтому при выходе оно не закрывается, а остается в пуле. Если за время
+    работы транспорт "умер", соединение сразу удаляется из пула — следующий
+    вызов переподключится, не натыкаясь на мертвый клиент.
+
+    Пример:
+        with acquire(host, user, key) as client:
+            execute_ssh_command(client, "qm list")
+    """
+    client = get_client(host, user, key, backend)
+    try:
+        yield client
+    finally:
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            pool_key = (host, user, key, backend)
+            with _ssh_pool_lock:
+                if _ssh_pool.get(pool_key) is client:
+                    del _ssh_pool[pool_key]
+            client.close()
+
+
+def close_all_clients() -> None:
+    """Закрывает все соединения пула (вызывается автоматически при выходе)."""
+    with _ssh_pool_lock:
+        for client in _ssh_pool.values():
+            client.close()
+        _ssh_pool.clear()
+
+
+atexit.register(close_all_clients)
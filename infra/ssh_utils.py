@@ -4,155 +4,534 @@
 Используется во всех частях фреймворка (deploy, tests, plugins) для унификации работы с paramiko.
 """
 
-import paramiko
+import math
+import re
+import select
 import time
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
-# Пытаемся импортировать coloredlogs для красивого вывода (опционально)
+# paramiko нужен только для аннотаций и SSHException в wait_for_ip: импорт
+# отложен, чтобы модуль (и infra.deploy) загружался без cryptography
+if TYPE_CHECKING:
+    import paramiko
+
+# orjson разбирает JSON в ~3 раза быстрее stdlib (опционально)
 try:
-    import coloredlogs
+    import orjson
 except ImportError:
-    coloredlogs = None
+    orjson = None
+
+_json_loads = orjson.loads if orjson else json.loads
 
 # Настройка логгера для этого модуля
 logger = logging.getLogger("ssh_utils")
 
+# Задержка перед повторным SSH вызовом в wait_for_ip после обрыва соединения
+# (экспоненциальная): сначала часто, затем реже, но не реже раза в 3с.
+IP_POLL_INITIAL_DELAY = 0.5
+IP_POLL_MAX_DELAY = 3.0
+IP_POLL_BACKOFF = 1.5
+
+# Окно и максимальный пакет канала (по умолчанию в paramiko 2 МБ и 32 КБ).
+# Окно — сколько данных сервер может отправить, не дожидаясь подтверждения:
+# на канале с большим RTT маленькое окно ограничивает скорость объемного
+# вывода (qm clone, скрипты подготовки). Крупный пакет — меньше накладных
+# расходов на заголовки и MAC.
+SSH_WINDOW_SIZE = 4 << 20
+SSH_MAX_PACKET_SIZE = 256 << 10
+
+# Размер порции чтения из SSH канала и период ожидания данных в select
+_RECV_CHUNK = 65536
+_SELECT_TIMEOUT = 1.0
+# Сколько ждать EOF после получения exit status (секунды).
+# Если команда оставила фоновый процесс, держащий stdout открытым, EOF может
+# не прийти никогда — не зависаем, а завершаем чтение по коду возврата.
+_EOF_GRACE = 0.2
+
+
+def _is_progress_line(line: str) -> bool:
+    """Строка прогресс-бара (qemu-img при клонировании): "transferred ... (N%)"."""
+    return "transferred" in line and "%" in line
+
+
+def _log_stdout_line(line: bytes) -> None:
+    """Пишет строку stdout в лог по мере поступления (без прогресс-бара)."""
+    text = line.decode(errors="replace").rstrip()
+    if text and not _is_progress_line(text):
+        logger.info("STDOUT: %s", text)
+
+
+def _emit_lines(buf: bytearray, start: int, on_line) -> int:
+    """
+    Передает в on_line все полные строки buf, начиная со смещения start.
+
+    :return: Смещение начала первой неполной (еще не переданной) строки.
+    """
+    end = buf.rfind(b"\n", start)
+    if end < 0:
+        return start
+    for line in bytes(buf[start:end]).split(b"\n"):
+        on_line(line)
+    return end + 1
+
+
+def _drain_channel(chan: "paramiko.Channel", on_line=None) -> tuple[bytes, bytes, int]:
+    """
+    Вычитывает stdout и stderr канала одновременно, затем получает exit status.
+    Завершение команды обнаруживается сразу по exit status, даже если EOF
+    задерживается.
+
+    Последовательные stdout.read() + stderr.read() опасны: если команда пишет
+    в stderr больше, чем вмещает окно канала, она блокируется, а мы ждем EOF
+    stdout — взаимная блокировка (deadlock). Поэтому читаем оба потока по мере
+    поступления данных (select по каналу), пока сервер не пришлет EOF.
+
+    :param on_line: Необязательный обработчик строк stdout (bytes): вызывается
+                    для каждой полной строки сразу по получении, не дожидаясь
+                    завершения команды.
+    :return: Кортеж (stdout, stderr, exit_status).
+    """
+    out_buf = bytearray()
+    err_buf = bytearray()
+    exit_deadline = None
+    # Смещение в out_buf, до которого строки уже переданы в on_line
+    emitted = 0
+
+    while True:
+        while chan.recv_ready():
+            out_buf += chan.recv(_RECV_CHUNK)
+        if on_line is not None:
+            emitted = _emit_lines(out_buf, emitted, on_line)
+        while chan.recv_stderr_ready():
+            err_buf += chan.recv_stderr(_RECV_CHUNK)
+        if chan.eof_received or chan.closed:
+            break
+        if chan.exit_status_ready():
+            # Процесс уже завершился: даем хвосту вывода короткое время догнать
+            # exit status, но не ждем EOF бесконечно
+            if exit_deadline is None:
+                exit_deadline = time.monotonic() + _EOF_GRACE
+            elif time.monotonic() >= exit_deadline:
+                break
+        # Ждем новых данных (или EOF) без активного опроса
+        select.select([chan], [], [], _EOF_GRACE if exit_deadline else _SELECT_TIMEOUT)
+
+    # После EOF в буферах могли остаться данные — добираем их
+    while chan.recv_ready():
+        out_buf += chan.recv(_RECV_CHUNK)
+    while chan.recv_stderr_ready():
+        err_buf += chan.recv_stderr(_RECV_CHUNK)
+    if on_line is not None:
+        emitted = _emit_lines(out_buf, emitted, on_line)
+        # Последняя строка без завершающего перевода строки
+        if emitted < len(out_buf):
+            on_line(bytes(out_buf[emitted:]))
+
+    # Потоки закрыты (или процесс уже завершился) — exit status не заблокирует
+    return bytes(out_buf), bytes(err_buf), chan.recv_exit_status()
+
+
 def execute_ssh_command(
-    client: paramiko.SSHClient,
+    client: "paramiko.SSHClient",
     command: str,
     dry_run: bool = False,
     print_output: bool = True,
     ignore_errors: bool = False,
     log_command: bool = True,
-) -> str:
+    return_status: bool = False,
+    binary: bool = False,
+    filter_progress: bool = True,
+) -> str | bytes | tuple[str | bytes, int]:
     """
     Выполняет SSH команду на удаленном сервере.
 
-    :param client: Активный SSH клиент paramiko.
+    :param client: Активный SSH клиент из пула (paramiko или infra.ssh_backend).
     :param command: Строка команды (bash).
     :param dry_run: Если True, команда не выполняется, только логируется.
-    :param print_output: Если True, вывод команды (stdout) пишется в лог INFO.
+    :param print_output: Если True, вывод команды (stdout) пишется в лог INFO
+                         построчно, по мере выполнения команды.
     :param ignore_errors: Если True, ошибки (exit code != 0) не выбрасывают
                           исключение (но логируются на уровне DEBUG).
     :param log_command: Если True, сама команда пишется в лог перед выполнением.
                         Стоит выключать для частых опросов (polling), чтобы не засорять лог.
-    :return: Строка stdout (обрезанная от пробелов).
+    :param return_status: Если True, возвращается кортеж (stdout, exit_status).
+                          Удобно для проверок "существует ли" без исключений
+                          (вместе с ignore_errors=True).
+    :param binary: Если True, stdout возвращается как bytes: без декодирования
+                   и фильтрации прогресс-бара. Для машинного вывода (JSON),
+                   который дальше разбирается парсером, принимающим bytes.
+    :param filter_progress: Если True (по умолчанию), из stdout удаляются строки
+                            прогресс-бара ("transferred ... (N%)"), которые пишут
+                            qm clone и qm importdisk. False — вывод как есть.
+    :return: Строка stdout (обрезанная от пробелов) или (stdout, exit_status).
     """
     if dry_run:
         if log_command:
-            logger.warning(f"[DRY-RUN] Would execute: {command}")
-        return "MOCK_OUTPUT_JSON"
+            logger.warning("[DRY-RUN] Would execute: %s", command)
+        mock_out = b"MOCK_OUTPUT_JSON" if binary else "MOCK_OUTPUT_JSON"
+        return (mock_out, 0) if return_status else mock_out
 
     if log_command:
-        logger.info(f"Executing: {command}")
+        logger.info("Executing: %s", command)
+
+    # Вывод пишется в лог сразу, а не после завершения долгой команды.
+    # Если INFO отключен, строки не декодируются и не выделяются вовсе.
+    on_line = _log_stdout_line if print_output and logger.isEnabledFor(logging.INFO) else None
 
-    # Выполняем команду
-    stdin, stdout, stderr = client.exec_command(command)
+    if getattr(type(client), "run_command", None) is not None:
+        # Альтернативный бэкенд (infra.ssh_backend) выполняет команду сам
+        out_bytes, err_bytes, exit_status = client.run_command(command, on_line=on_line)
+    else:
+        # Выполняем команду в отдельном канале поверх уже открытого транспорта
+        chan = client.get_transport().open_session(
+            window_size=SSH_WINDOW_SIZE, max_packet_size=SSH_MAX_PACKET_SIZE
+        )
+        try:
+            chan.exec_command(command)
+            # stdin не используется: сразу сообщаем об этом удаленной стороне
+            chan.shutdown_write()
+            # Читаем stdout/stderr параллельно и получаем код возврата
+            out_bytes, err_bytes, exit_status = _drain_channel(chan, on_line=on_line)
+        finally:
+            chan.close()
 
-    # Читаем и декодируем вывод (stdout и stderr)
-    out_str = stdout.read().decode().strip()
-    err_str = stderr.read().decode().strip()
-    
-    # Получаем код возврата (блокирует выполнение до завершения команды)
-    exit_status = stdout.channel.recv_exit_status()
+    # Декодируем stdout; stderr нужен только при ошибке (см. ниже) — на частых
+    # успешных опросах его не декодируем (вычитывать его все равно нужно, см. _drain_channel)
+    if binary:
+        out_str = out_bytes.strip()
+    else:
+        out_str = out_bytes.decode().strip()
 
     # --- Фильтрация "мусора" из stdout ---
     # Некоторые утилиты (например, qemu-img при клонировании) пишут прогресс-бар
     # в stdout, создавая сотни строк вида "transferred ...".
     # Это засоряет лог-файлы и консоль. Убираем их.
-    if out_str:
-        filtered_lines = []
-        for line in out_str.splitlines():
-            # Если строка содержит признаки прогресс-бара (проценты + слово transferred), пропускаем
-            if "transferred" in line and "%" in line:
-                continue
-            filtered_lines.append(line)
-        out_str = "\n".join(filtered_lines).strip()
-
-    # Вывод результата в лог, если требуется
-    if print_output and out_str:
-        logger.info(f"--- STDOUT ---\n{out_str}\n--------------")
+    # Построчный разбор нужен только если признак прогресс-бара вообще есть
+    # в выводе: одна проверка подстроки (в C) вместо цикла по всем строкам.
+    if filter_progress and out_str and not binary and "transferred" in out_str:
+        out_str = "\n".join(
+            [line for line in out_str.splitlines() if not _is_progress_line(line)]
+        ).strip()
 
     # Обработка ошибок
     if exit_status != 0:
+        err_str = err_bytes.decode().strip()
         if ignore_errors:
             # Если ошибка ожидаема (например, проверка существования файла),
             # пишем в DEBUG, чтобы не пугать пользователя красным цветом.
             logger.debug(
-                f"Command failed (expected/ignored). Exit: {exit_status}. Error: {err_str}"
+                "Command failed (expected/ignored). Exit: %s. Error: %s",
+                exit_status, err_str,
             )
         else:
             # Критическая ошибка выполнения команды
-            logger.error(f"Command failed (Exit: {exit_status}): {command}")
+            logger.error("Command failed (Exit: %s): %s", exit_status, command)
             if err_str:
-                logger.error(f"--- STDERR ---\n{err_str}\n--------------")
+                logger.error("--- STDERR ---\n%s\n--------------", err_str)
             raise Exception(f"SSH Command failed: {err_str}")
 
+    if return_status:
+        return out_str, exit_status
     return out_str
 
 
+# Пауза между запросами к агенту внутри удаленного цикла (секунды) растет
+# экспоненциально: 0.25 -> 0.4 -> 0.64 -> ... -> IP_POLL_INTERVAL. Быстро
+# загрузившаяся ВМ обнаруживается за доли секунды, а на долгой загрузке
+# `qm guest cmd` запускается не чаще раза в IP_POLL_INTERVAL.
+IP_POLL_REMOTE_INITIAL_DELAY = 0.25
+IP_POLL_REMOTE_BACKOFF = 1.6
+IP_POLL_INTERVAL = 2
+
+# jq фильтр: первый IPv4 адрес 10.x на интерфейсе, отличном от loopback.
+# first(...) прекращает обход на первом совпадении (без лишнего `| head`)
+_IP_JQ_FILTER = (
+    'first(.[] | select(.name != "lo") | .["ip-addresses"][]?'
+    ' | select(.["ip-address-type"] == "ipv4")'
+    ' | .["ip-address"] | select(startswith("10.")))'
+)
+
+# Цикл ожидания IP на стороне хоста (код 1 — таймаут).
+# Если на хосте есть jq, адрес извлекается там же и по сети приходит одна
+# строка с IP. Иначе ответ агента возвращается целиком, но только когда
+# в нем уже есть адрес 10.x: grep ищет только сам адрес (порядок ключей
+# в JSON не гарантирован), тип (ipv4) и интерфейс проверяет _parse_lan_ip.
+# Последовательность пауз передается позиционными параметрами (set --):
+# после каждой попытки берется следующая, последняя повторяется до конца.
+_IP_WAIT_SCRIPT = (
+    "end=$(( $(date +%s) + {timeout} )); "
+    "set -- {delays}; "
+    "command -v jq >/dev/null 2>&1 && have_jq=1 || have_jq=; "
+    "while :; do "
+    "if out=$(qm guest cmd {vm_id} network-get-interfaces 2>/dev/null); then "
+    "if [ -n \"$have_jq\" ]; then "
+    "ip=$(printf '%s' \"$out\" | jq -r '" + _IP_JQ_FILTER + "' 2>/dev/null); "
+    "[ -n \"$ip\" ] && {{ echo \"$ip\"; exit 0; }}; "
+    "elif printf '%s' \"$out\" | grep -Eq '\"ip-address\" *: *\"10\\.'; then "
+    "printf '%s' \"$out\"; exit 0; "
+    "fi; "
+    "fi; "
+    "[ $(date +%s) -ge $end ] && exit 1; "
+    "sleep \"$1\"; [ $# -gt 1 ] && shift; "
+    "done"
+)
+
+
+def _remote_poll_delays(max_delay: float) -> str:
+    """
+    Последовательность пауз удаленного цикла ожидания IP.
+
+    :param max_delay: Максимальная пауза (секунды).
+    :return: Паузы через пробел, например "0.25 0.4 0.64 1.02 1.64 2".
+    """
+    delays = []
+    delay = IP_POLL_REMOTE_INITIAL_DELAY
+    while delay < max_delay:
+        delays.append(delay)
+        delay *= IP_POLL_REMOTE_BACKOFF
+    delays.append(max_delay)
+    return " ".join(format(round(d, 2), "g") for d in delays)
+
+# Ошибки, после которых опрос Guest Agent повторяется:
+# - OSError — проблемы транспорта (обрыв, таймаут сокета); paramiko.SSHException
+#   добавляется в wait_for_ip (paramiko импортируется лениво);
+# - ValueError — битый JSON (json.JSONDecodeError и orjson.JSONDecodeError наследуют его);
+# - KeyError / TypeError / AttributeError — JSON неожиданной структуры.
+_IP_POLL_RETRY_ERRORS = (
+    OSError,
+    ValueError,
+    KeyError,
+    TypeError,
+    AttributeError,
+)
+
+# Маркеры шагов в выводе execute_ssh_script
+_STEP_MARKER_RE = re.compile(r"^==STEP:(\w+)==$", re.MULTILINE)
+_FAILED_MARKER_RE = re.compile(r"==FAILED:(\w+)==")
+
+
+def execute_ssh_script(
+    client: "paramiko.SSHClient",
+    steps: list[tuple[str, str]],
+    dry_run: bool = False,
+    print_output: bool = True,
+    filter_progress: bool = True,
+) -> dict[str, str]:
+    """
+    Выполняет последовательность шагов ОДНИМ SSH вызовом (bash-скрипт через heredoc).
+
+    Каждый exec_command — это отдельный round-trip (открытие канала + ожидание
+    exit status). Склейка шагов в один скрипт платит эту цену один раз.
+    Скрипт выполняется с `set -e`: первый упавший шаг прерывает выполнение,
+    а его имя попадает в текст исключения.
+
+    :param client: Активный SSH клиент paramiko.
+    :param steps: Список пар (имя_шага, команда). Имя — латиница/цифры/_.
+                  Если ошибку шага нужно игнорировать — добавьте `|| true` в команду.
+    :param dry_run: Если True, скрипт не выполняется, только логируется.
+    :param print_output: Если True, вывод скрипта пишется в лог INFO.
+    :param filter_progress: Если True, строки прогресс-бара удаляются из вывода
+                            (см. execute_ssh_command).
+    :return: Словарь {имя_шага: stdout шага}.
+    """
+    lines = [
+        "set -e",
+        # При ошибке сообщаем в stderr, на каком шаге упали
+        "trap 'echo \"==FAILED:$__step==\" >&2' ERR",
+    ]
+    for name, command in steps:
+        lines.append(f"__step={name}; echo '==STEP:{name}=='")
+        lines.append(command)
+    script = "\n".join(lines)
+
+    try:
+        out = execute_ssh_command(
+            client,
+            f"bash -s <<'__CPRO_SCRIPT__'\n{script}\n__CPRO_SCRIPT__",
+            dry_run=dry_run,
+            print_output=print_output,
+            filter_progress=filter_progress,
+        )
+    except Exception as e:
+        failed = _FAILED_MARKER_RE.search(str(e))
+        step = failed.group(1) if failed else "unknown"
+        raise Exception(f"SSH script failed at step '{step}': {e}") from e
+
+    # Разбиваем вывод по маркерам: [до_маркеров, имя1, вывод1, имя2, вывод2, ...]
+    parts = _STEP_MARKER_RE.split(out)
+    return {
+        name: output.strip()
+        for name, output in zip(parts[1::2], parts[2::2])
+    }
+
+
+# Адрес 10.x в ответе агента. Такой адрес может быть только IPv4 и не бывает
+# на loopback (127.0.0.1), поэтому совпадение равносильно проверкам find_lan_ip,
+# а порядок ключей внутри объекта адреса не важен.
+_LAN_IP_RE = re.compile(rb'"ip-address"\s*:\s*"(10(?:\.[0-9]{1,3}){3})"')
+
+
+def _parse_lan_ip(json_out: str | bytes) -> str | None:
+    """
+    Извлекает первый IPv4 адрес локальной сети (10.x) из ответа
+    QEMU Guest Agent (network-get-interfaces).
+
+    Адрес ищется регулярным выражением по сырым байтам, без построения
+    словарей; полный разбор JSON — только если выражение не сработало.
+
+    :param json_out: JSON ответ агента или уже готовый адрес
+                     (если на хосте его извлек jq, см. _IP_WAIT_SCRIPT).
+    :return: IP адрес или None, если подходящего адреса нет.
+    """
+    text = json_out.strip()
+    if isinstance(text, str):
+        text = text.encode()
+    if not text.startswith(b"["):
+        # Адрес уже извлечен на хосте — JSON разбирать не нужно
+        return text.decode() if text.startswith(b"10.") else None
+
+    match = _LAN_IP_RE.search(text)
+    if match:
+        return match.group(1).decode()
+    return find_lan_ip(_json_loads(text))
+
+
+def find_lan_ip(interfaces: list) -> str | None:
+    """
+    Ищет первый IPv4 адрес локальной сети (10.x) в списке интерфейсов
+    QEMU Guest Agent (уже разобранный ответ network-get-interfaces).
+
+    :param interfaces: Список интерфейсов агента.
+    :return: IP адрес или None, если подходящего адреса нет.
+    """
+    for iface in interfaces:
+        # Игнорируем loopback интерфейс
+        if iface.get("name") == "lo":
+            continue
+
+        # Ищем первый попавшийся IPv4 адрес
+        for addr in iface.get("ip-addresses", []):
+            if addr["ip-address-type"] == "ipv4":
+                ip = addr["ip-address"]
+                # Фильтр для локальной сети (чтобы не взять какой-нибудь Docker IP)
+                # Можно вынести префикс в конфиг, если нужно
+                if ip.startswith("10."):
+                    return ip
+    return None
+
+
 def wait_for_ip(
-    client: paramiko.SSHClient,
+    client: "paramiko.SSHClient",
     vm_id: int,
     dry_run: bool = False,
     timeout: int = 60,
+    poll_interval: float = IP_POLL_INTERVAL,
 ) -> str | None:
     """
     Ожидает появления IP-адреса у ВМ через QEMU Guest Agent.
-    Повторяет запрос каждые 3 секунды до истечения таймаута.
-    
+
+    Цикл опроса выполняется на хосте (см. _IP_WAIT_SCRIPT): один SSH вызов
+    вместо запроса на каждую попытку, JSON разбирается один раз — когда
+    в ответе агента уже есть адрес 10.x. Первый запрос выполняется сразу,
+    паузы между запросами растут от 0.25с до poll_interval. Если SSH соединение оборвалось,
+    вызов повторяется с экспоненциальной задержкой (0.5с -> 3с).
+
     :param client: SSH клиент (подключенный к гипервизору Proxmox).
     :param vm_id: ID виртуальной машины.
     :param timeout: Максимальное время ожидания в секундах.
+    :param poll_interval: Максимальная пауза между запросами к агенту на хосте (секунды).
     :return: IP адрес (str) или None, если не найден.
     """
-    logger.info(f"⏳ Waiting for IP address (Max {timeout}s)...")
-    start_time = time.time()
+    logger.info("⏳ Waiting for IP address (Max %ss)...", timeout)
+    if dry_run:
+        return "10.DRY.RUN.IP"
+
+    import paramiko
+
+    retry_errors = (paramiko.SSHException, *_IP_POLL_RETRY_ERRORS)
+    # monotonic: chronyd может перевести часы свежезагруженного узла во время ожидания
+    deadline = time.monotonic() + timeout
+    delay = IP_POLL_INITIAL_DELAY
+    attempts = 0
 
-    while time.time() - start_time < timeout:
-        if dry_run:
-            return "10.DRY.RUN.IP"
+    while True:
+        # Удаленный цикл получает оставшееся время (целые секунды, с округлением вверх)
+        remaining = math.ceil(deadline - time.monotonic())
+        if remaining <= 0:
+            break
 
+        attempts += 1
         try:
-            # Запрашиваем список интерфейсов у агента
-            # log_command=False, чтобы не спамить в лог "Executing: ..." каждые 3 секунды
-            json_out = execute_ssh_command(
+            # log_command=False, чтобы не писать в лог shell-цикл целиком
+            json_out, rc = execute_ssh_command(
                 client,
-                f"qm guest cmd {vm_id} network-get-interfaces",
+                _IP_WAIT_SCRIPT.format(
+                    vm_id=vm_id, timeout=remaining, delays=_remote_poll_delays(poll_interval)
+                ),
                 print_output=False,
                 ignore_errors=True,
-                log_command=False, 
+                log_command=False,
+                return_status=True,
+                binary=True,
             )
-
-            # Если агент еще не ответил или вернул пустоту
-            if not json_out:
-                time.sleep(3)
-                continue
-
-            # Парсим JSON ответ от QEMU Guest Agent
-            data = json.loads(json_out)
-
-            for iface in data:
-                # Игнорируем loopback интерфейс
-                if iface.get("name") == "lo":
-                    continue
-                
-                # Ищем первый попавшийся IPv4 адрес
-                for addr in iface.get("ip-addresses", []):
-                    if addr["ip-address-type"] == "ipv4":
-                        ip = addr["ip-address"]
-                        # Фильтр для локальной сети (чтобы не взять какой-нибудь Docker IP)
-                        # Можно вынести префикс в конфиг, если нужно
-                        if ip.startswith("10."):
-                            logger.info(f"✅ IP FOUND: {ip}")
-                            return ip
-        except Exception:
-            # Любая ошибка (SSH отвалился, JSON битый) — просто пробуем снова
+            # Сначала разбираем вывод: найденный адрес принимается независимо
+            # от кода возврата, код проверяется только если адреса нет
+            ip = _parse_lan_ip(json_out) if json_out else None
+            if ip:
+                logger.info("✅ IP FOUND: %s", ip)
+                logger.debug(
+                    "IP for VM %s found after %.1fs (%d SSH call(s))",
+                    vm_id, timeout - (deadline - time.monotonic()), attempts,
+                )
+                return ip
+            if rc != 0:
+                # Удаленный цикл исчерпал таймаут — адрес так и не появился
+                break
+        except retry_errors:
+            # SSH отвалился или JSON битый/неожиданной формы — просто пробуем снова.
+            # Прочие исключения (ошибки в коде, Ctrl+C) пробрасываем сразу.
             pass
 
-        time.sleep(3)
+        # Экспоненциальная задержка перед повторным SSH вызовом
+        time.sleep(delay)
+        delay = min(IP_POLL_MAX_DELAY, delay * IP_POLL_BACKOFF)
 
     logger.warning("⚠️  Timeout waiting for IP. Guest Agent might not be running.")
     return None
 
+
+# Максимум одновременных ожиданий IP на одном соединении: каждое занимает
+# канал, а sshd по умолчанию разрешает не более 10 (MaxSessions)
+MAX_PARALLEL_IP_WAITS = 8
+
+
+def wait_for_ips(
+    client: "paramiko.SSHClient",
+    vm_ids: list[int],
+    dry_run: bool = False,
+    timeout: int = 60,
+) -> dict[int, str | None]:
+    """
+    Ожидает IP-адреса нескольких ВМ одновременно (по потоку на ВМ).
+
+    Каждый поток открывает свой канал поверх общего транспорта, поэтому
+    общее время равно самому долгому ожиданию, а не сумме (для бэкенда ssh2
+    тоже: каналы одной сессии libssh2, см. infra.ssh_backend).
+
+    :param client: SSH клиент (подключенный к гипервизору Proxmox).
+    :param vm_ids: ID виртуальных машин.
+    :param timeout: Максимальное время ожидания каждой ВМ в секундах.
+    :return: Словарь {vm_id: IP адрес или None}.
+    """
+    if not vm_ids:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_IP_WAITS, len(vm_ids))) as executor:
+        ips = executor.map(
+            lambda vm_id: wait_for_ip(client, vm_id, dry_run=dry_run, timeout=timeout),
+            vm_ids,
+        )
+        return dict(zip(vm_ids, ips))
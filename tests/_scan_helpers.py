@@ -0,0 +1,125 @@
+"""
+Общая логика поиска хардкод-дефолтов конфигурации в исходниках проекта.
+
+Используется тестами правила "Хардкод запрещен" (test_config_no_hardcode.py):
+ищет вызовы .get("запрещенный_ключ", <дефолт>) во всех .py файлах.
+"""
+import ast
+import hashlib
+from pathlib import Path
+
+# Ключ кэша результатов сканирования в .pytest_cache (pytest cache provider)
+SCAN_CACHE_KEY = "cpro/ast_scan"
+
+# Хэш исходника самого сканера: кэш действителен только для той версии правил,
+# которой он построен (иначе после правки _DefaultFinder тест продолжал бы
+# проходить по сохраненному вердикту)
+SCANNER_DIGEST = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16).hexdigest()
+
+
+class _DefaultFinder(ast.NodeVisitor):
+    """
+    Собирает вызовы .get("запрещенный_ключ", <дефолт>) за один обход AST.
+    Обрабатываются только узлы Call, остальные обходятся generic_visit.
+    """
+
+    def __init__(self, path: str, keys: frozenset):
+        self.path = path
+        self.keys = keys
+        self.violations = []
+
+    def visit_Call(self, node: ast.Call) -> None:
+        func = node.func
+        # Вызов метода .get() с ключом-константой и дефолтом (второй аргумент)
+        if (
+            isinstance(func, ast.Attribute)
+            and func.attr == "get"
+            and len(node.args) >= 2
+            and isinstance(node.args[0], ast.Constant)
+            and node.args[0].value in self.keys
+        ):
+            self.violations.append({
+                "file": self.path,
+                "line": node.lineno,
+                "key": node.args[0].value,
+                "default": ast.unparse(node.args[1]),
+            })
+        # Вложенные вызовы (аргументы, цепочки) тоже проверяем
+        self.generic_visit(node)
+
+
+def _scan_file(py_file: Path, project_root: Path, keys: frozenset) -> list:
+    """
+    Ищет запрещенные дефолты в одном файле.
+
+    :return: Список нарушений (пустой для файла с синтаксической ошибкой).
+    """
+    # ast.parse принимает bytes: кодировку (BOM, coding-комментарий)
+    # определяет сам парсер, без декодирования в Python
+    try:
+        tree = ast.parse(py_file.read_bytes(), filename=str(py_file))
+    except SyntaxError:
+        # Пропускаем файлы с синтаксическими ошибками
+        return []
+
+    finder = _DefaultFinder(str(py_file.relative_to(project_root)), keys)
+    finder.visit(tree)
+    return finder.violations
+
+
+def scan_forbidden_defaults(
+    project_root: Path,
+    keys: frozenset,
+    scan_dirs: list[Path],
+    cache=None,
+) -> list[dict]:
+    """
+    Ищет .get("ключ", <дефолт>) для ключей из keys во всех .py файлах scan_dirs.
+
+    Результаты по каждому файлу кэшируются между запусками pytest
+    (ключ — mtime и размер файла): повторно разбираются только измененные файлы.
+    После изменения самого сканера (этого модуля) кэш не используется.
+
+    :param project_root: Корень проекта (пути в нарушениях — относительно него).
+    :param keys: Ключи конфигурации, для которых дефолты запрещены.
+    :param scan_dirs: Директории для рекурсивного сканирования.
+    :param cache: request.config.cache или None (без кэша).
+    :return: Список нарушений {"file", "line", "key", "default"}.
+    """
+    # Рекурсивно собираем все .py файлы (кроме __pycache__ и т.п.)
+    py_files = [
+        py_file
+        for scan_dir in scan_dirs
+        if scan_dir.exists()
+        for py_file in scan_dir.rglob("*.py")
+        if "__pycache__" not in str(py_file)
+    ]
+
+    # Кэш прошлых запусков: {путь: [mtime_ns, size, нарушения]}.
+    # Кэш действителен только для того же набора ключей и той же версии сканера.
+    cached = cache.get(SCAN_CACHE_KEY, {}) if cache is not None else {}
+    if cached.get("keys") != sorted(keys) or cached.get("scanner") != SCANNER_DIGEST:
+        cached = {}
+    cached_files = cached.get("files", {})
+
+    file_results = {}
+    stale_files = []
+    for py_file in py_files:
+        st = py_file.stat()
+        entry = cached_files.get(str(py_file))
+        if entry is not None and entry[:2] == [st.st_mtime_ns, st.st_size]:
+            file_results[str(py_file)] = entry
+        else:
+            stale_files.append((py_file, st))
+
+    for py_file, st in stale_files:
+        file_results[str(py_file)] = [
+            st.st_mtime_ns, st.st_size, _scan_file(py_file, project_root, keys)
+        ]
+
+    if cache is not None and (stale_files or len(file_results) != len(cached_files)):
+        cache.set(SCAN_CACHE_KEY, {
+            "keys": sorted(keys), "scanner": SCANNER_DIGEST, "files": file_results,
+        })
+
+    return [v for entry in file_results.values() for v in entry[2]]
@@ -5,9 +5,19 @@ import sys
 # Добавляем корень проекта в sys.path, чтобы видеть infra
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from infra.config import get_node_params
+@pytest.fixture(autouse=True)
+def clear_config_cache():
+    """
+    Сбрасывает кэш load_config перед каждым тестом: конфиг, прочитанный
+    одним тестом, не должен подменять файл, подготовленный другим.
+    """
+    # Импорт в теле фикстуры: сбор тестов (--collect-only, -k) не грузит infra
+    from infra.config import load_config
+
+    load_config.cache_clear()
+    yield
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def target_node():
     """
     Имя ноды, на которой запускаем тесты.
@@ -16,12 +26,15 @@ def target_node():
     """
     return os.getenv("TEST_NODE", "r")
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def ssh_config(target_node):
     """
     Возвращает параметры подключения (host, user, key) для выбранной ноды.
     Читает их из config.yaml через infra.config.
+    Один раз на сессию pytest: конфиг и TEST_NODE во время прогона не меняются.
     """
+    from infra.config import get_node_params
+
     try:
         params = get_node_params(target_node)
         return {
@@ -32,4 +45,20 @@ def ssh_config(target_node):
     except ValueError as e:
         pytest.fail(f"Invalid configuration for node '{target_node}': {e}")
 
+@pytest.fixture(scope="session")
+def live_ssh(ssh_config):
+    """
+    SSH клиент к тестовой ноде, общий для всех тестов сессии:
+    handshake и аутентификация выполняются один раз, а не в каждом тесте.
+    """
+    import paramiko
 
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(
+        hostname=ssh_config["host"],
+        username=ssh_config["user"],
+        key_filename=ssh_config["sshkey"],
+    )
+    yield client
+    client.close()
@@ -0,0 +1,154 @@
+"""
+Тесты кэширования конфигурации (infra/config.py).
+
+Проверяем, что config.yaml парсится один раз на процесс,
+а изменение файла (mtime) приводит к перечитыванию.
+"""
+import os
+from unittest.mock import patch
+
+import pytest
+import yaml
+
+from infra import config as config_mod
+from infra.config import load_config, get_node_params
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    """Временный config.yaml с одним узлом."""
+    path = tmp_path / "config.yaml"
+    path.write_text("default_node: r\nnodes:\n  r:\n    host: 10.0.0.1\n")
+    return path
+
+
+def test_load_config_parses_once(config_file):
+    """Повторный вызов load_config не должен заново парсить YAML."""
+    with patch.object(yaml, "load", wraps=yaml.load) as spy:
+        first = load_config(str(config_file))
+        second = load_config(str(config_file))
+
+    assert first == second
+    assert first["nodes"]["r"]["host"] == "10.0.0.1"
+    assert spy.call_count == 1, "YAML должен парситься ровно один раз"
+
+
+def test_load_config_uses_safe_loader(config_file):
+    """Парсер должен быть безопасным (Safe), C-версия — если доступна."""
+    _, loader = config_mod._get_yaml_loader()
+    assert loader.__name__ in ("CSafeLoader", "SafeLoader")
+
+    # Безопасный загрузчик не создает произвольные Python-объекты
+    config_file.write_text("evil: !!python/object/apply:os.system ['true']\n")
+    assert load_config(str(config_file)) == {}
+
+
+def test_load_config_returns_independent_copy(config_file):
+    """Изменение результата вызывающим кодом не должно портить кэш."""
+    first = load_config(str(config_file))
+    first["nodes"]["r"]["host"] = "MUTATED"
+
+    second = load_config(str(config_file))
+    assert second["nodes"]["r"]["host"] == "10.0.0.1"
+
+
+def test_load_config_reloads_on_mtime_change(config_file):
+    """При изменении файла (новый mtime) конфиг перечитывается."""
+    assert load_config(str(config_file))["default_node"] == "r"
+
+    config_file.write_text("default_node: pve9\n")
+    st = os.stat(config_file)
+    # Гарантируем другой mtime даже на ФС с грубым разрешением времени
+    os.utime(config_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    assert load_config(str(config_file))["default_node"] == "pve9"
+
+
+def test_key_path_expanded_once_per_path(config_file):
+    """key_path раскрывается (~ -> $HOME) один раз на путь, конфиг при этом не меняется."""
+    config_file.write_text(
+        "nodes:\n"
+        "  r:\n"
+        "    host: 10.0.0.1\n"
+        "    user: root\n"
+        "    key_path: ~/.ssh/id_ed25519\n"
+        "    storage: ram\n"
+        "    storage_path: /mnt/ram\n"
+    )
+    config = load_config(str(config_file))
+    assert config["nodes"]["r"] == {
+        "host": "10.0.0.1",
+        "user": "root",
+        "key_path": "~/.ssh/id_ed25519",
+        "storage": "ram",
+        "storage_path": "/mnt/ram",
+    }
+
+    expected = os.path.expanduser("~/.ssh/id_ed25519")
+    config_mod._expand_key_path.cache_clear()
+    assert get_node_params("r", config)["key"] == expected
+
+    with patch.object(config_mod.os.path, "expanduser") as mock_expand:
+        params = get_node_params("r", config)
+
+    mock_expand.assert_not_called()
+    assert params["key"] == expected
+
+
+def test_load_config_missing_file_returns_empty(tmp_path):
+    """Отсутствующий файл -> пустой конфиг (без исключения)."""
+    assert load_config(str(tmp_path / "absent.yaml")) == {}
+
+
+def test_load_config_uses_json_cache_in_new_process(config_file):
+    """
+    Новый процесс (пустой lru_cache) берет конфиг из JSON кэша,
+    не разбирая YAML, пока файл не изменился.
+    """
+    first = load_config(str(config_file))
+    assert os.path.exists(str(config_file) + config_mod.CACHE_SUFFIX)
+
+    load_config.cache_clear()
+    with patch.object(yaml, "load", wraps=yaml.load) as spy:
+        second = load_config(str(config_file))
+
+    assert second == first
+    spy.assert_not_called()
+
+
+def test_load_config_ignores_stale_json_cache(config_file):
+    """JSON кэш от старой версии файла не используется."""
+    load_config(str(config_file))
+
+    config_file.write_text("default_node: pve9\n")
+    st = os.stat(config_file)
+    os.utime(config_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    load_config.cache_clear()
+
+    assert load_config(str(config_file))["default_node"] == "pve9"
+
+
+def test_yaml_loader_warns_without_libyaml(monkeypatch, caplog):
+    """Без libyaml используется SafeLoader и выводится предупреждение."""
+    monkeypatch.delattr(yaml, "CSafeLoader", raising=False)
+    config_mod._get_yaml_loader.cache_clear()
+    try:
+        with caplog.at_level("WARNING", logger="config"):
+            _, loader = config_mod._get_yaml_loader()
+    finally:
+        config_mod._get_yaml_loader.cache_clear()
+
+    assert loader is yaml.SafeLoader
+    assert "libyaml" in caplog.text
+
+
+def test_json_cache_survives_touch(config_file):
+    """touch без изменения содержимого не заставляет заново разбирать YAML."""
+    load_config(str(config_file))
+
+    st = os.stat(config_file)
+    os.utime(config_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    with patch.object(yaml, "load", wraps=yaml.load) as spy:
+        assert load_config(str(config_file))["default_node"] == "r"
+
+    spy.assert_not_called()
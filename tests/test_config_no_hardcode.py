@@ -15,21 +15,25 @@
 """
 import pytest
 import os
-import ast
 from pathlib import Path
 from unittest.mock import patch, mock_open
 
+from _scan_helpers import scan_forbidden_defaults
+
 
 # Список конфигурационных ключей, для которых запрещены дефолты в коде
-FORBIDDEN_CONFIG_KEYS_WITH_DEFAULTS = [
+# (frozenset: проверка принадлежности за O(1))
+FORBIDDEN_CONFIG_KEYS_WITH_DEFAULTS = frozenset([
     "storage_path",
     "ram_disk_size_gb",
     "host",
     "user",
     "key_path",
     "storage",
+    "api_verify_ssl",
+    "backend",
     # TODO: Добавлять сюда новые ключи по мере развития проекта
-]
+])
 
 
 class TestConfigNoHardcode:
@@ -148,6 +152,42 @@ class TestConfigNoHardcode:
         assert ram_size is None, \
             "При отсутствии ram_disk_size_gb должен возвращаться None (tmpfs auto)"
 
+    def test_api_verify_ssl_required_with_api_token(self):
+        """
+        С api_token проверка сертификата должна быть задана в config.yaml явно:
+        дефолта в коде нет.
+        """
+        from infra.config import get_node_params
+
+        node_conf = {
+            "host": "10.0.0.1",
+            "user": "root",
+            "key_path": "~/.ssh/id_rsa",
+            "storage": "ram",
+            "storage_path": "/mnt/ramdisk/stor",
+            "api_token": "root@pam!t=uuid",
+        }
+
+        with pytest.raises(ValueError, match="api_verify_ssl"):
+            get_node_params("test_node", {"nodes": {"test_node": node_conf}})
+
+        node_conf["api_verify_ssl"] = False
+        params = get_node_params("test_node", {"nodes": {"test_node": node_conf}})
+        assert params["api_verify_ssl"] is False
+
+    @pytest.mark.parametrize("config", [{}, {"ssh": None}, {"ssh": {}}])
+    def test_ssh_backend_required(self, config):
+        """
+        ssh.backend должен быть задан в config.yaml явно: отсутствие секции ssh
+        или ключа — понятная ошибка, а не подставленный дефолт или KeyError.
+        """
+        from infra.config import get_ssh_backend
+
+        with pytest.raises(ValueError, match=r"'ssh\.backend' in config\.yaml"):
+            get_ssh_backend(config)
+
+        assert get_ssh_backend({"ssh": {"backend": "ssh2"}}) == "ssh2"
+
     def test_deploy_ram_disk_size_not_used(self):
         """
         НОВЫЙ ТЕСТ: Проверяем, что deploy.ram_disk_size_gb больше НЕ используется.
@@ -163,15 +203,17 @@ class TestConfigNoHardcode:
         if not os.path.exists(CONFIG_PATH):
             pytest.skip("config.yaml не найден")
         
-        with open(CONFIG_PATH, 'r') as f:
-            config = yaml.safe_load(f)
+        # C-загрузчик libyaml, если PyYAML собран с ним
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        with open(CONFIG_PATH, 'rb') as f:
+            config = yaml.load(f, Loader=loader)
         
         # Проверяем, что deploy.ram_disk_size_gb отсутствует
         deploy_section = config.get("deploy", {})
         assert "ram_disk_size_gb" not in deploy_section, \
             "deploy.ram_disk_size_gb должен быть удален! Теперь параметр специфичен для узла."
 
-    def test_no_hardcoded_defaults_in_entire_project(self):
+    def test_no_hardcoded_defaults_in_entire_project(self, request):
         """
         УНИВЕРСАЛЬНЫЙ ТЕСТ: Проверяем отсутствие хардкода дефолтов
         во ВСЕХ Python-файлах проекта (включая будущие).
@@ -184,6 +226,10 @@ class TestConfigNoHardcode:
         - conftest.py (фикстуры pytest)
         
         Легальные дефолты должны быть ТОЛЬКО в config.yaml!
+
+        Результаты по каждому файлу кэшируются между запусками pytest
+        (ключ — mtime и размер файла, версия сканера): повторно разбираются
+        только измененные файлы.
         """
         # Корневая директория проекта
         project_root = Path(__file__).parent.parent
@@ -194,48 +240,13 @@ class TestConfigNoHardcode:
             # project_root / "plugins",  # TODO: раскомментировать когда появится
         ]
         
-        violations = []  # Список нарушений
-        
-        for scan_dir in scan_dirs:
-            if not scan_dir.exists():
-                continue
-                
-            # Рекурсивно обходим все .py файлы
-            for py_file in scan_dir.rglob("*.py"):
-                # Пропускаем __pycache__ и т.п.
-                if "__pycache__" in str(py_file):
-                    continue
-                
-                with open(py_file, 'r', encoding='utf-8') as f:
-                    try:
-                        source = f.read()
-                        tree = ast.parse(source)
-                    except SyntaxError:
-                        # Пропускаем файлы с синтаксическими ошибками
-                        continue
-                
-                # Ищем вызовы .get() с запрещенными ключами и дефолтами
-                for node in ast.walk(tree):
-                    if isinstance(node, ast.Call):
-                        # Проверяем, что это вызов метода .get()
-                        if (hasattr(node.func, 'attr') and 
-                            node.func.attr == 'get' and 
-                            len(node.args) >= 1):
-                            
-                            # Извлекаем имя ключа (первый аргумент)
-                            if isinstance(node.args[0], ast.Constant):
-                                key_name = node.args[0].value
-                                
-                                # Проверяем, запрещен ли этот ключ для дефолтов
-                                if key_name in FORBIDDEN_CONFIG_KEYS_WITH_DEFAULTS:
-                                    # Если есть второй аргумент (дефолт) - нарушение!
-                                    if len(node.args) >= 2:
-                                        violations.append({
-                                            "file": str(py_file.relative_to(project_root)),
-                                            "line": node.lineno,
-                                            "key": key_name,
-                                            "default": ast.unparse(node.args[1])
-                                        })
+        # Кэш между запусками (cache provider может быть отключен: -p no:cacheprovider)
+        violations = scan_forbidden_defaults(
+            project_root,
+            FORBIDDEN_CONFIG_KEYS_WITH_DEFAULTS,
+            scan_dirs,
+            cache=getattr(request.config, "cache", None),
+        )
         
         # Формируем подробное сообщение об ошибках
         if violations:
@@ -259,6 +270,35 @@ class TestConfigNoHardcode:
             
             pytest.fail("".join(error_msg))
 
+    def test_scan_cache_ignored_after_scanner_change(self, tmp_path):
+        """
+        Сохраненный вердикт другой версии сканера не используется:
+        файл разбирается заново.
+        """
+        from _scan_helpers import SCAN_CACHE_KEY
+
+        py_file = tmp_path / "mod.py"
+        py_file.write_text('cfg.get("host", "10.0.0.1")\n')
+        st = py_file.stat()
+
+        class FakeCache(dict):
+            def set(self, key, value):
+                self[key] = value
+
+        # "Чистый" вердикт, сохраненный старой версией сканера
+        cache = FakeCache({SCAN_CACHE_KEY: {
+            "keys": ["host"],
+            "scanner": "old",
+            "files": {str(py_file): [st.st_mtime_ns, st.st_size, []]},
+        }})
+
+        violations = scan_forbidden_defaults(
+            tmp_path, frozenset(["host"]), [tmp_path], cache=cache
+        )
+
+        assert [v["key"] for v in violations] == ["host"]
+        assert cache[SCAN_CACHE_KEY]["scanner"] != "old"
+
     def test_config_yaml_has_required_keys(self):
         """
         Проверяем, что config.yaml содержит все обязательные ключи.
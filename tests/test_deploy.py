@@ -1,47 +1,76 @@
+import logging
+import sys
+from types import SimpleNamespace
+
 import pytest
 from unittest.mock import MagicMock, patch
-from infra.deploy import deploy_vm
+from infra.deploy import deploy_vm, deploy_vms
+
+# Параметры узла, которые возвращает замоканный get_node_params
+NODE_PARAMS = {
+    "host": "1.2.3.4",
+    "user": "root",
+    "key": "key",
+    "storage": "ram",
+    "storage_path": "/mnt/ram_test",
+    "ram_disk_size_gb": None,
+}
+
+# Секция ssh конфига (ssh.backend обязателен)
+SSH_CFG = {"backend": "paramiko"}
+
+
+@pytest.fixture
+def mocks():
+    """
+    Патчит все внешние вызовы deploy_vm: конфиг, параметры узла, пул SSH,
+    команды на хосте, подготовку хранилища, очистку RAM и ожидание IP.
+
+    По умолчанию: конфиг с одной секцией ssh, узел NODE_PARAMS, ВМ с новым ID
+    не существует (qm status -> код 2), IP получен.
+    """
+    with (
+        patch("infra.deploy.load_config", return_value={"ssh": SSH_CFG}) as load,
+        patch("infra.deploy.get_node_params", return_value=dict(NODE_PARAMS)) as get_node,
+        patch("infra.deploy.get_client") as get_client,
+        patch("infra.deploy.execute_ssh_command", return_value=("", 2)) as exec_cmd,
+        patch("infra.deploy.execute_ssh_script") as script,
+        patch("infra.deploy.wait_for_ip", return_value="10.0.0.1") as wait,
+        patch("infra.deploy.prepare_storage_steps", return_value=[("mount", "MOUNT_CMD")]) as prepare,
+        patch("infra.deploy.cleanup_ram_vms") as cleanup,
+    ):
+        yield SimpleNamespace(
+            load=load, get_node=get_node, get_client=get_client, exec=exec_cmd,
+            script=script, wait=wait, prepare=prepare, cleanup=cleanup,
+        )
+
 
 # Патчим input, чтобы тест не вис на вопросе "Destroy VM?"
+# (вопрос задается только при запуске из терминала)
+@patch("infra.deploy.sys.stdin.isatty", return_value=True)
 @patch("builtins.input", return_value="y")
-@patch("infra.deploy.load_config")
-@patch("infra.deploy.get_node_params")
-@patch("infra.deploy.paramiko.SSHClient")
-@patch("infra.deploy.execute_ssh_command")
-@patch("infra.deploy.wait_for_ip")
-# Патчим prepare_storage, чтобы проверить факт его вызова
-@patch("infra.deploy.prepare_storage") 
-def test_deploy_vm_calls_prepare_storage(
-    mock_prepare, mock_wait, mock_exec, mock_ssh_cls, mock_get_node, mock_load, mock_input
-):
+def test_deploy_vm_prepares_storage_in_script(mock_input, mock_isatty, mocks):
     """
-    Проверяем, что deploy_vm вызывает функцию подготовки хранилища (prepare_storage).
+    Проверяем, что deploy_vm готовит хранилище через infra.proxmox
+    (prepare_storage_steps) в составе общего скрипта.
     Это гарантирует, что мы избавились от bash-скриптов.
     
     ОБНОВЛЕНО: ram_disk_size_gb теперь читается из nodes.<node>, а не из deploy.
     """
     # 1. Настройка моков
-    mock_load.return_value = {
+    mocks.load.return_value = {
         "deploy": {"memory": 2048}, 
-        "logging": {"level": "DEBUG"}
+        "logging": {"level": "DEBUG"},
+        "ssh": SSH_CFG,
         # ram_disk_size_gb удален из deploy!
     }
     
     # ram_disk_size_gb теперь возвращается из get_node_params (специфично для узла)
-    mock_get_node.return_value = {
-        "host": "1.2.3.4", 
-        "user": "root", 
-        "key": "key", 
-        "storage": "ram",
-        "storage_path": "/mnt/ram_test",
-        "ram_disk_size_gb": 42  # ✅ Теперь здесь (из nodes.test_node)
-    }
-    
-    mock_client = MagicMock()
-    mock_ssh_cls.return_value = mock_client
-    
-    # Имитируем успешное получение IP
-    mock_wait.return_value = "10.0.0.1"
+    mocks.get_node.return_value = {**NODE_PARAMS, "ram_disk_size_gb": 42}
+
+    # qm status завершается успешно -> ВМ существует
+    mocks.exec.return_value = ("status: stopped", 0)
+    mocks.prepare.return_value = [("mount", "MOUNT_CMD"), ("storage_dirs", "MKDIR_CMD")]
 
     # 2. Запуск функции
     # dry_run=False нужен, чтобы дойти до реальной логики вызовов
@@ -56,24 +85,393 @@ def test_deploy_vm_calls_prepare_storage(
 
     # 3. Проверки (Assertions)
     
-    # Проверка 1: prepare_storage вызвана 1 раз
-    mock_prepare.assert_called_once()
+    # Проверка 1: шаги хранилища запрошены 1 раз
+    mocks.prepare.assert_called_once()
     
     # Проверка 2: переданы правильные аргументы (из node_params)
-    _, kwargs = mock_prepare.call_args
+    _, kwargs = mocks.prepare.call_args
     assert kwargs['storage_path'] == "/mnt/ram_test"
     assert kwargs['ram_size_gb'] == 42  # ✅ Теперь из nodes.test_node
 
-    # Проверка 3: клонирование запущено
-    clone_found = False
-    for call in mock_exec.call_args_list:
-        cmd = call[0][1]
-        if "qm clone 100 200" in cmd:
-            clone_found = True
-            break
-    assert clone_found, "Команда qm clone не была вызвана!"
+    # Проверка 3: клонирование запущено (destroy/clone/start — один SSH вызов)
+    mocks.script.assert_called_once()
+    steps = dict(mocks.script.call_args[0][1])
+    assert "qm clone 100 200" in steps["clone"], "Команда qm clone не была вызвана!"
+    # ВМ "существует" (qm status успешен), пользователь подтвердил удаление;
+    # хранилище готовится в том же скрипте перед клонированием
+    assert list(steps) == [
+        "stop", "destroy", "mount", "storage_dirs", "clone", "configure", "start"
+    ]
 
-    # Проверка 4: результат функции
+    # Проверка 4: существование ВМ проверено одним вызовом (по коду возврата)
+    mocks.exec.assert_called_once()
+    assert mocks.exec.call_args[0][1] == "qm status 200"
+    assert mocks.exec.call_args[1]["return_status"] is True
+
+    # Проверка 5: соединение взято из пула по параметрам узла
+    mocks.get_client.assert_called_once_with("1.2.3.4", "root", "key", backend="paramiko")
+
+    # Проверка 6: результат функции
     assert res["id"] == 200
     assert res["ip"] == "10.0.0.1"
 
+
+@patch("builtins.input")
+def test_deploy_vm_new_id_skips_destroy(mock_input, mocks):
+    """
+    Если ВМ с таким ID нет (qm status != 0), пользователя не спрашиваем
+    и шаги stop/destroy в скрипт не попадают.
+    """
+    mocks.exec.return_value = ("Configuration file does not exist", 2)
+
+    res = deploy_vm(template_id=100, snap_name="snap1", new_vm_id=200, target_node="test_node")
+
+    mock_input.assert_not_called()
+    steps = dict(mocks.script.call_args[0][1])
+    assert list(steps) == ["mount", "clone", "configure", "start"]
+    assert res == {"id": 200, "ip": "10.0.0.1"}
+
+
+def test_deploy_vm_confirm_callback_declines(mocks):
+    """confirm_callback решает вместо input(): отказ -> ВМ не трогаем."""
+    mocks.exec.return_value = ("status: running", 0)
+    asked = []
+
+    def decline(vm_id):
+        asked.append(vm_id)
+        return False
+
+    res = deploy_vm(
+        template_id=100, snap_name="s", new_vm_id=200, target_node="n",
+        confirm_callback=decline,
+    )
+
+    assert asked == [200]
+    assert res == {"id": 200, "ip": None}
+    mocks.script.assert_not_called()
+
+
+def test_deploy_vm_force_checks_existence_on_host(mocks):
+    """
+    С force отдельного вызова qm status нет: проверка существования
+    и удаление старой ВМ выполняются в общем скрипте.
+    """
+    res = deploy_vm(template_id=100, snap_name="s", new_vm_id=200, target_node="n", force=True)
+
+    mocks.exec.assert_not_called()
+    steps = dict(mocks.script.call_args[0][1])
+    assert list(steps) == ["replace", "mount", "clone", "configure", "start"]
+    assert steps["replace"].startswith("if qm status 200 ")
+    assert "qm destroy 200 --skiplock --purge" in steps["replace"]
+    assert res == {"id": 200, "ip": "10.0.0.1"}
+
+
+@patch("builtins.input")
+@patch("infra.deploy.sys.stdin.isatty", return_value=False)
+def test_confirm_destroy_prompt_without_tty(mock_isatty, mock_input):
+    """Без терминала вопрос не задается, удаление не подтверждается."""
+    from infra.deploy import confirm_destroy_prompt
+
+    assert confirm_destroy_prompt(200) is False
+    mock_input.assert_not_called()
+
+
+@patch("infra.deploy._prepare_node_storage")
+@patch("infra.deploy.setup_logging")
+@patch("infra.deploy.load_config")
+@patch("infra.deploy.deploy_vm")
+def test_deploy_vms_runs_all_specs_in_order(mock_deploy, mock_load, mock_setup_logging, mock_prepare):
+    """
+    Пакетный деплой: каждая спецификация передается в deploy_vm,
+    результаты возвращаются в исходном порядке, падение одной ВМ
+    (sys.exit внутри deploy_vm) не прерывает остальные.
+    """
+    def fake_deploy(**kwargs):
+        if kwargs["new_vm_id"] == 202:
+            raise SystemExit(1)
+        return {"id": kwargs["new_vm_id"], "ip": f"10.0.0.{kwargs['new_vm_id'] - 200}"}
+
+    mock_deploy.side_effect = fake_deploy
+    specs = [
+        {"template_id": 100, "snap_name": "s", "new_vm_id": 201, "target_node": "r"},
+        {"template_id": 100, "snap_name": "s", "new_vm_id": 202, "target_node": "pve9"},
+        {"template_id": 100, "snap_name": "s", "new_vm_id": 203, "target_node": "r"},
+    ]
+
+    results = deploy_vms(specs)
+
+    assert results == [
+        {"id": 201, "ip": "10.0.0.1"},
+        {"id": 202, "ip": None},
+        {"id": 203, "ip": "10.0.0.3"},
+    ]
+    assert mock_deploy.call_count == 3
+
+    # Конфиг и логирование — один раз на пакет; вопросов в терминале нет
+    mock_load.assert_called_once()
+    mock_setup_logging.assert_called_once()
+    for call in mock_deploy.call_args_list:
+        assert call.kwargs["config"] is mock_load.return_value
+        assert call.kwargs["confirm_callback"](call.kwargs["new_vm_id"]) is False
+
+
+@patch("infra.deploy.prepare_storage")
+@patch("infra.deploy.deploy_vm")
+def test_deploy_vms_prepares_storage_once_per_node(mock_deploy, mock_prepare_storage, mocks):
+    """
+    Две ВМ на одном узле: хранилище монтируется один раз до запуска потоков,
+    сами деплои шаги хранилища не выполняют (иначе второй tmpfs мог бы
+    перекрыть первый).
+    """
+    mocks.get_node.return_value = {**NODE_PARAMS, "ram_disk_size_gb": 16}
+    mock_deploy.side_effect = lambda **kwargs: {"id": kwargs["new_vm_id"], "ip": "10.0.0.1"}
+    cfg = {"ssh": SSH_CFG}
+    specs = [
+        {"template_id": 100, "snap_name": "s", "new_vm_id": 201, "target_node": "r"},
+        {"template_id": 100, "snap_name": "s", "new_vm_id": 202, "target_node": "r"},
+    ]
+
+    results = deploy_vms(specs, config=cfg)
+
+    assert [r["ip"] for r in results] == ["10.0.0.1", "10.0.0.1"]
+    mocks.get_node.assert_called_once_with("r", cfg)
+    mock_prepare_storage.assert_called_once_with(
+        mocks.get_client.return_value, storage_path="/mnt/ram_test", ram_size_gb=16, dry_run=False
+    )
+    assert [call.kwargs["prepare_ram_storage"] for call in mock_deploy.call_args_list] == [False, False]
+
+
+@pytest.mark.parametrize("node_specs, expected", [
+    pytest.param(
+        [{"dry_run": True}, {}],
+        {"dry_run": False, "ram_size_gb": 16},
+        id="real_deploy_after_dry_run_mounts_storage",
+    ),
+    pytest.param(
+        [{"ram_size": 8}, {"ram_size": 32}, {}],
+        {"dry_run": False, "ram_size_gb": 32},
+        id="largest_ram_size_wins",
+    ),
+    pytest.param(
+        [{"ram_size": 8}, {}],
+        {"dry_run": False, "ram_size_gb": 16},
+        id="node_default_counts_for_spec_without_size",
+    ),
+    pytest.param(
+        [{"dry_run": True, "ram_size": 64}, {"ram_size": 8}],
+        {"dry_run": False, "ram_size_gb": 8},
+        id="dry_run_size_ignored_for_real_mount",
+    ),
+    pytest.param(
+        [{"prepare_ram_storage": False, "ram_size": 64}, {"dry_run": True}],
+        {"dry_run": True, "ram_size_gb": 16},
+        id="spec_without_storage_ignored",
+    ),
+])
+@patch("infra.deploy.prepare_storage")
+@patch("infra.deploy.deploy_vm")
+def test_deploy_vms_prepares_storage_for_mixed_specs(
+    mock_deploy, mock_prepare_storage, mocks, node_specs, expected
+):
+    """Разные спецификации одного узла: хранилище готовится под все сразу."""
+    mocks.get_node.return_value = {**NODE_PARAMS, "ram_disk_size_gb": 16}
+    mock_deploy.side_effect = lambda **kwargs: {"id": kwargs["new_vm_id"], "ip": "10.0.0.1"}
+    specs = [
+        {"template_id": 100, "snap_name": "s", "new_vm_id": 201 + i, "target_node": "r", **extra}
+        for i, extra in enumerate(node_specs)
+    ]
+
+    deploy_vms(specs, config={"ssh": SSH_CFG})
+
+    mock_prepare_storage.assert_called_once()
+    assert mock_prepare_storage.call_args.kwargs == {"storage_path": "/mnt/ram_test", **expected}
+
+
+@patch("infra.deploy.prepare_storage")
+@patch("infra.deploy.deploy_vm")
+def test_deploy_vms_without_storage_preparation(mock_deploy, mock_prepare_storage, mocks):
+    """Ни одной спецификации узла хранилище не нужно -> оно не готовится, деплой идет."""
+    mock_deploy.side_effect = lambda **kwargs: {"id": kwargs["new_vm_id"], "ip": "10.0.0.1"}
+    specs = [{
+        "template_id": 100, "snap_name": "s", "new_vm_id": 201, "target_node": "r",
+        "prepare_ram_storage": False,
+    }]
+
+    results = deploy_vms(specs, config={"ssh": SSH_CFG})
+
+    assert results == [{"id": 201, "ip": "10.0.0.1"}]
+    mock_prepare_storage.assert_not_called()
+    mocks.get_node.assert_not_called()
+
+
+@patch("infra.deploy._prepare_node_storage")
+@patch("infra.deploy.deploy_vm")
+def test_deploy_vms_skips_node_with_failed_storage(mock_deploy, mock_prepare_node, mocks):
+    """Хранилище узла не подготовлено -> ВМ этого узла не разворачиваются."""
+    def fake_prepare(node, node_specs, config):
+        if node == "pve9":
+            raise Exception("mount failed")
+
+    mock_prepare_node.side_effect = fake_prepare
+    mock_deploy.side_effect = lambda **kwargs: {"id": kwargs["new_vm_id"], "ip": "10.0.0.1"}
+    specs = [
+        {"template_id": 100, "snap_name": "s", "new_vm_id": 201, "target_node": "r"},
+        {"template_id": 100, "snap_name": "s", "new_vm_id": 202, "target_node": "pve9"},
+    ]
+
+    results = deploy_vms(specs, config={})
+
+    assert results == [{"id": 201, "ip": "10.0.0.1"}, {"id": 202, "ip": None}]
+    assert [call.kwargs["new_vm_id"] for call in mock_deploy.call_args_list] == [201]
+
+
+def test_deploy_vm_without_storage_preparation(mocks):
+    """prepare_ram_storage=False: шагов хранилища в скрипте нет."""
+    deploy_vm(
+        template_id=100, snap_name="s", new_vm_id=200, target_node="n",
+        prepare_ram_storage=False,
+    )
+
+    mocks.prepare.assert_not_called()
+    assert list(dict(mocks.script.call_args[0][1])) == ["clone", "configure", "start"]
+
+
+def test_deploy_vms_empty():
+    """Пустой список — пустой результат, без создания потоков."""
+    assert deploy_vms([]) == []
+
+
+def test_deploy_vm_uses_passed_config(mocks):
+    """Переданный конфиг используется как есть — config.yaml повторно не читается."""
+    cfg = {"deploy": {"memory": 4096}, "logging": {"level": "DEBUG"}, "ssh": SSH_CFG}
+
+    deploy_vm(template_id=100, snap_name="s", new_vm_id=200, target_node="n", config=cfg)
+
+    mocks.load.assert_not_called()
+    mocks.get_node.assert_called_once_with("n", cfg)
+    steps = dict(mocks.script.call_args[0][1])
+    assert "--memory 4096" in steps["configure"]
+
+
+def test_deploy_vm_requires_ssh_backend_in_config(mocks, caplog):
+    """ssh.backend не задан в конфиге -> понятная ошибка, бэкенд не подставляется."""
+    with pytest.raises(SystemExit), caplog.at_level("CRITICAL", logger="deploy"):
+        deploy_vm(template_id=100, snap_name="s", new_vm_id=200, target_node="n", config={})
+
+    assert "Missing required parameter 'ssh.backend' in config.yaml" in caplog.text
+    mocks.get_client.assert_not_called()
+    mocks.script.assert_not_called()
+
+
+def test_deploy_vm_uses_provided_client(mocks):
+    """Переданный клиент используется для всех команд — пул не запрашивается."""
+    client = MagicMock()
+
+    deploy_vm(
+        template_id=100, snap_name="s", new_vm_id=200, target_node="n",
+        config={}, client=client,
+    )
+
+    mocks.get_client.assert_not_called()
+    assert mocks.exec.call_args[0][0] is client
+    assert mocks.script.call_args[0][0] is client
+    assert mocks.wait.call_args[0][0] is client
+
+
+def test_deploy_vm_purges_ram_vms_on_request(mocks):
+    """purge_ram_vms=True очищает RAM-хранилище узла до запуска скрипта деплоя."""
+    mocks.get_node.return_value = {**NODE_PARAMS, "storage": "ramdisk_stor"}
+    client = MagicMock()
+
+    deploy_vm(
+        template_id=100, snap_name="s", new_vm_id=200, target_node="n",
+        config={}, client=client, purge_ram_vms=True,
+    )
+    mocks.cleanup.assert_called_once_with(client, storage_name="ramdisk_stor", dry_run=False)
+
+    mocks.cleanup.reset_mock()
+    deploy_vm(template_id=100, snap_name="s", new_vm_id=200, target_node="n", config={}, client=client)
+    mocks.cleanup.assert_not_called()
+
+
+@patch("infra.deploy.sys.stderr.isatty", return_value=True)
+def test_setup_logging_runs_once(mock_isatty, monkeypatch):
+    """Повторные вызовы setup_logging не переустанавливают обработчики."""
+    from infra import deploy
+    monkeypatch.setattr(deploy, "_logging_initialized", False)
+    fake_coloredlogs = MagicMock()
+    monkeypatch.setitem(sys.modules, "coloredlogs", fake_coloredlogs)
+
+    deploy.setup_logging("DEBUG")
+    deploy.setup_logging("DEBUG")
+
+    fake_coloredlogs.install.assert_called_once()
+
+
+@patch("infra.deploy.logging.basicConfig")
+@patch("infra.deploy.sys.stderr.isatty", return_value=False)
+def test_setup_logging_without_tty_skips_coloredlogs(mock_isatty, mock_basic, monkeypatch):
+    """Без терминала (CI) coloredlogs не используется — обычный basicConfig."""
+    from infra import deploy
+    monkeypatch.setattr(deploy, "_logging_initialized", False)
+    fake_coloredlogs = MagicMock()
+    monkeypatch.setitem(sys.modules, "coloredlogs", fake_coloredlogs)
+    root_level = logging.getLogger().level
+
+    try:
+        deploy.setup_logging("DEBUG")
+    finally:
+        logging.getLogger().setLevel(root_level)
+
+    fake_coloredlogs.install.assert_not_called()
+    mock_basic.assert_called_once()
+
+
+@patch("infra.proxmox_api.wait_for_ip_api", return_value="10.0.0.7")
+def test_deploy_vm_waits_for_ip_via_api_when_token_set(mock_wait_api, mocks):
+    """С api_token у узла IP ожидается через REST API, а не через SSH."""
+    mocks.get_node.return_value = {
+        **NODE_PARAMS,
+        "api_token": "root@pam!t=uuid",
+        "api_node": "pve",
+        "api_verify_ssl": False,
+    }
+
+    res = deploy_vm(template_id=100, snap_name="s", new_vm_id=200, target_node="n")
+
+    assert res == {"id": 200, "ip": "10.0.0.7"}
+    mocks.wait.assert_not_called()
+    assert mock_wait_api.call_args[0][1:] == ("1.2.3.4", "pve", 200)
+
+
+def test_deploy_vm_purge_runs_before_existence_check(mocks):
+    """
+    Очистка RAM выполняется до qm status: ВМ, удаленная очисткой,
+    уже не существует, и шаги stop/destroy в скрипт не попадают.
+    """
+    order = []
+    existing = {200}
+
+    def fake_cleanup(client, storage_name, dry_run):
+        # Старая ВМ 200 целиком в RAM — очистка ее удаляет
+        order.append("cleanup")
+        existing.discard(200)
+
+    def fake_status(client, command, **kwargs):
+        order.append("status")
+        return ("", 0 if 200 in existing else 2)
+
+    mocks.cleanup.side_effect = fake_cleanup
+    mocks.exec.side_effect = fake_status
+    confirm = MagicMock(return_value=True)
+
+    res = deploy_vm(
+        template_id=100, snap_name="s", new_vm_id=200, target_node="n",
+        confirm_callback=confirm, purge_ram_vms=True,
+    )
+
+    assert order == ["cleanup", "status"]
+    confirm.assert_not_called()
+    steps = dict(mocks.script.call_args[0][1])
+    assert list(steps) == ["mount", "clone", "configure", "start"]
+    assert res == {"id": 200, "ip": "10.0.0.1"}
@@ -0,0 +1,58 @@
+"""
+Тесты клиента Proxmox REST API (infra/proxmox_api.py).
+
+HTTP не используется: requests.Session и time.sleep замоканы.
+"""
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from infra import proxmox_api
+from infra.proxmox_api import get_session, wait_for_ip_api
+
+AGENT_RESULT = {"data": {"result": [
+    {"name": "lo", "ip-addresses": [
+        {"ip-address-type": "ipv4", "ip-address": "127.0.0.1"},
+    ]},
+    {"name": "eth0", "ip-addresses": [
+        {"ip-address-type": "ipv4", "ip-address": "10.33.33.101"},
+    ]},
+]}}
+
+
+def make_response(ok=True, payload=None, status_code=200):
+    resp = MagicMock()
+    resp.ok = ok
+    resp.status_code = status_code
+    resp.json.return_value = payload
+    return resp
+
+
+def test_get_session_reuses_session_with_token(monkeypatch):
+    """Сессия создается один раз на узел и несет заголовок авторизации."""
+    monkeypatch.setattr(proxmox_api, "_sessions", {})
+
+    first = get_session("10.0.0.1", "root@pam!t=uuid", verify_ssl=False)
+    second = get_session("10.0.0.1", "root@pam!t=uuid", verify_ssl=False)
+
+    assert first is second
+    assert first.headers["Authorization"] == "PVEAPIToken=root@pam!t=uuid"
+    assert first.verify is False
+
+
+@patch("infra.proxmox_api.time.sleep")
+def test_wait_for_ip_api_retries_until_agent_ready(mock_sleep):
+    """Пока агент не запущен (HTTP 500) или сеть сбоит — повторяем запрос."""
+    session = MagicMock()
+    session.get.side_effect = [
+        make_response(ok=False, status_code=500),
+        requests.ConnectionError("reset"),
+        make_response(payload=AGENT_RESULT),
+    ]
+
+    assert wait_for_ip_api(session, "10.0.0.1", "r", 101, timeout=600) == "10.33.33.101"
+    assert session.get.call_count == 3
+    url = session.get.call_args[0][0]
+    assert url == (
+        "https://10.0.0.1:8006/api2/json/nodes/r/qemu/101/agent/network-get-interfaces"
+    )
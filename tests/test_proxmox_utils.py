@@ -1,67 +1,122 @@
 import pytest
-from unittest.mock import MagicMock, patch
-from infra.proxmox import check_vm_safety, prepare_storage, cleanup_ram_vms
+from types import SimpleNamespace
+from unittest.mock import patch
+from infra.proxmox import (
+    check_vm_safety, cleanup_ram_vms, is_disk_key, parse_vm_config,
+    prepare_storage, prepare_storage_steps,
+)
 
 @pytest.fixture
 def mock_ssh_client():
-    client = MagicMock()
-    stdout = MagicMock()
-    stdout.read.return_value = b""
-    stdout.channel.recv_exit_status.return_value = 0
-    stderr = MagicMock()
-    stderr.read.return_value = b""
-    client.exec_command.return_value = (None, stdout, stderr)
-    return client
+    """
+    Клиент-заглушка. Команды идут через замоканный execute_ssh_command,
+    поэтому клиент только передается дальше — дерево MagicMock не нужно.
+    """
+    return SimpleNamespace()
 
 # Тесты безопасности (Unit tests)
 
-def test_check_vm_safety_safe_vm():
-    """Тест безопасной ВМ (все диски в RAM и правильного формата)"""
-    config = """
+@pytest.mark.parametrize("config, expected", [
+    pytest.param(
+        """
 scsi0: ram:100/vm-100-disk-0.qcow2,size=32G,ssd=1
 efidisk0: ram:100/vm-100-disk-1.qcow2,size=128K
 ide2: local:iso/image.iso,media=cdrom
-    """
-    assert check_vm_safety("100", config, "ram") is True
-
-def test_check_vm_safety_unsafe_mixed_storage():
-    """Тест опасной ВМ (один диск на local-lvm)"""
-    config = """
+        """,
+        True,
+        id="safe_vm",  # все диски в RAM и правильного формата
+    ),
+    pytest.param(
+        """
 scsi0: ram:100/vm-100-disk-0.qcow2,size=32G
 scsi1: local-lvm:vm-100-disk-1.raw,size=10G
-    """
-    assert check_vm_safety("100", config, "ram") is False
-
-def test_check_vm_safety_unsafe_pattern():
-    """Тест опасной ВМ (диск на RAM, но не matches паттерн disk+size+qcow2)"""
-    config = """
+        """,
+        False,
+        id="unsafe_mixed_storage",  # один диск на local-lvm
+    ),
+    pytest.param(
+        """
 scsi0: ram:100/vm-100-root.raw,size=32G
-    """
-    # qcow2 нет -> unsafe
-    assert check_vm_safety("100", config, "ram") is False
-    
-    config2 = """
+        """,
+        False,
+        id="unsafe_pattern_no_qcow2",  # диск на RAM, но qcow2 нет
+    ),
+    pytest.param(
+        """
 scsi0: ram:100/vm-100-disk-0.qcow2
-    """
-    # size нет -> unsafe (строгая проверка)
-    assert check_vm_safety("100", config2, "ram") is False
+        """,
+        False,
+        id="unsafe_pattern_no_size",  # size нет (строгая проверка)
+    ),
+    pytest.param(
+        """
+scsihw: virtio-scsi-single
+scsi0: ram:100/vm-100-disk-0.qcow2,size=32G
+        """,
+        False,
+        id="controller_type_blocks_purge",  # scsihw считается диском не на RAM
+    ),
+    pytest.param(
+        """
+scsi0: ram:100/vm-100-disk-0.qcow2,size=32G
 
-def test_check_vm_safety_no_disks():
-    """ВМ без дисков (только CDROM) не должна удаляться"""
-    config = """
+[before_update]
+scsi0: local-lvm:vm-100-disk-0,size=32G
+        """,
+        False,
+        id="checks_snapshot_sections",  # диск на другом хранилище в секции снапшота
+    ),
+    pytest.param(
+        """
+scsi0: local-lvm:vm-100-disk-0,size=32G
+
+[before_move]
+scsi0: ram:100/vm-100-disk-0.qcow2,size=32G
+        """,
+        False,
+        id="snapshot_does_not_mask_current_disk",  # текущий диск на local-lvm
+    ),
+    pytest.param(
+        """
 ide2: local:iso/image.iso,media=cdrom
 memory: 1024
-    """
-    assert check_vm_safety("100", config, "ram") is False
+        """,
+        False,
+        id="no_disks",  # только CDROM — не удаляем
+    ),
+])
+def test_check_vm_safety(config, expected):
+    """Удалять можно только ВМ, все диски которой в RAM и соответствуют паттерну"""
+    assert check_vm_safety("100", config, "ram") is expected
+
+
+def test_parse_vm_config_and_disk_keys():
+    """Разбор конфига: комментарии и пустые строки пропускаются, значение — после первого ':'"""
+    config = parse_vm_config(
+        "# comment\n"
+        "scsi0: ram:100/vm-100-disk-0.qcow2,size=32G\n"
+        "\n"
+        "scsihw: virtio-scsi-pci\n"
+        "memory: 2048\n"
+    )
+    assert config == {
+        "scsi0": "ram:100/vm-100-disk-0.qcow2,size=32G",
+        "scsihw": "virtio-scsi-pci",
+        "memory": "2048",
+    }
+    assert [key for key in config if is_disk_key(key)] == ["scsi0", "scsihw"]
 
 
 # Интеграционные тесты (с патчем execute_ssh_command)
 
-@patch("infra.proxmox.execute_ssh_command")
+# Патчим на уровне ssh_utils: prepare_storage идет через execute_ssh_script,
+# который собирает скрипт и вызывает execute_ssh_command
+@patch("infra.ssh_utils.execute_ssh_command")
 def test_prepare_storage_dry_run(mock_execute, mock_ssh_client):
     """
     Проверка вызова prepare_storage (dry-run).
-    В dry-run проверка (grep) пропускается, сразу идут команды монтирования.
+    Проверка "уже смонтировано?" выполняется на хосте (mountpoint -q),
+    поэтому вся подготовка — один SSH вызов (скрипт из шагов).
     """
     mock_execute.return_value = "" 
 
@@ -72,18 +127,35 @@ def test_prepare_storage_dry_run(mock_execute, mock_ssh_client):
         dry_run=True
     )
     
-    # Проверяем, что execute_ssh_command вызывался
-    assert mock_execute.called
+    # Проверяем, что execute_ssh_command вызывался ровно один раз
+    mock_execute.assert_called_once()
     
-    # Проверяем конкретные команды (в dry-run мы сразу монтируем)
-    calls = [args[0][1] for args in mock_execute.call_args_list]
+    # Проверяем конкретные команды внутри скрипта
+    script = mock_execute.call_args[0][1]
     
+    # Проверка на хосте: уже смонтированный tmpfs не перемонтируется
+    assert "mountpoint -q /mnt/ram_test" in script
     # mkdir для точки монтирования
-    assert "mkdir -p /mnt/ram_test" in calls
+    assert "mkdir -p /mnt/ram_test" in script
     # Само монтирование
-    assert "mount -t tmpfs -o size=16G tmpfs /mnt/ram_test" in calls
+    assert "mount -t tmpfs -o size=16G tmpfs /mnt/ram_test" in script
     # Создание структуры папок
-    assert any("mkdir -p /mnt/ram_test/{images" in c for c in calls)
+    assert "mkdir -p /mnt/ram_test/{images" in script
+
+
+def test_prepare_storage_steps_default_size():
+    """ram_size_gb=None -> опция size не передается (tmpfs использует 50% RAM)."""
+    steps = dict(prepare_storage_steps("/mnt/ram", ram_size_gb=None))
+    assert "mount -t tmpfs tmpfs /mnt/ram" in steps["mount"]
+    assert "size=" not in steps["mount"]
+
+
+def test_prepare_storage_steps_force_remount():
+    """force_remount: сначала umount, затем безусловное монтирование."""
+    steps = prepare_storage_steps("/mnt/ram", ram_size_gb=8, force_remount=True)
+    names = [name for name, _ in steps]
+    assert names == ["umount", "mount", "storage_dirs"]
+    assert "mountpoint" not in dict(steps)["mount"]
 
 @patch("infra.proxmox.execute_ssh_command")
 def test_cleanup_ram_vms_dry_run(mock_execute, mock_ssh_client):
@@ -92,16 +164,47 @@ def test_cleanup_ram_vms_dry_run(mock_execute, mock_ssh_client):
     """
     # Настраиваем side_effect для имитации ответов команд
     mock_execute.side_effect = [
-        "/etc/pve/qemu-server/100.conf\n", # 1. ls
-        "scsi0: ram:100/vm-100-disk-0.qcow2,size=10G\n", # 2. cat 100.conf (SAFE)
-        "", # 3. stop (успех)
-        "", # 4. destroy (успех)
+        # 1. Все конфиги одним вызовом: 100 (SAFE) и 101 (на другом хранилище)
+        "===/etc/pve/qemu-server/100.conf===\n"
+        "scsi0: ram:100/vm-100-disk-0.qcow2,size=10G\n"
+        "===/etc/pve/qemu-server/101.conf===\n"
+        "scsi0: local-lvm:vm-101-disk-0,size=10G\n",
+        "", # 2. stop + destroy ВМ 100 одной командой (успех)
     ]
     
     cleanup_ram_vms(mock_ssh_client, storage_name="ram", dry_run=True)
     
-    # Проверяем, что были вызовы stop и destroy
-    calls = [args[0][1] for args in mock_execute.call_args_list]
-    assert "qm stop 100 --skiplock" in calls
-    assert "qm destroy 100 --skiplock --purge" in calls
+    # Два SSH вызова: чтение конфигов и удаление ВМ 100
+    assert mock_execute.call_count == 2
+    destroy_cmd = mock_execute.call_args_list[1][0][1]
+    assert "qm stop 100 --skiplock" in destroy_cmd
+    assert "qm destroy 100 --skiplock --purge" in destroy_cmd
+    assert "101" not in destroy_cmd
+
+
+
+@patch("infra.proxmox.execute_ssh_command")
+def test_cleanup_ram_vms_destroy_failure_does_not_stop_others(mock_execute, mock_ssh_client):
+    """
+    ВМ удаляются параллельно; ошибка удаления одной не мешает остальным.
+    """
+    configs = "".join(
+        f"===/etc/pve/qemu-server/{vm_id}.conf===\n"
+        f"scsi0: ram:{vm_id}/vm-{vm_id}-disk-0.qcow2,size=10G\n"
+        for vm_id in (100, 101, 102)
+    )
+
+    def fake_execute(client, command, **kwargs):
+        if command.startswith("awk"):
+            return configs
+        if "qm destroy 101" in command:
+            raise Exception("Command failed")
+        return ""
+
+    mock_execute.side_effect = fake_execute
+
+    cleanup_ram_vms(mock_ssh_client, storage_name="ram", dry_run=True)
 
+    commands = [args[0][1] for args in mock_execute.call_args_list]
+    for vm_id in (100, 101, 102):
+        assert f"qm stop {vm_id} --skiplock; qm destroy {vm_id} --skiplock --purge" in commands
@@ -0,0 +1,197 @@
+"""
+Тесты бэкенда libssh2 (infra/ssh_backend.py).
+
+Сеть не используется: сокет и сессия libssh2 замоканы. Каналы отдают
+заранее заданные результаты чтения (размер, данные), как ssh2-python
+в неблокирующем режиме.
+"""
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import paramiko
+import pytest
+
+pytest.importorskip("ssh2")
+
+from infra import ssh_backend
+from infra.ssh_backend import LIBSSH2_ERROR_EAGAIN, SSH2Error, Ssh2Client
+
+AGAIN = (LIBSSH2_ERROR_EAGAIN, b"")
+
+
+class FakeChannel:
+    """
+    Канал libssh2: read/read_stderr отдают результаты по очереди, после
+    исчерпания — (0, b"") (EOF потока). eof() становится True, когда оба
+    потока исчерпаны, либо на eof_polls-м вызове, если он задан.
+    """
+
+    def __init__(self, out=(), err=(), exit_status=0, eof_polls=None):
+        self.out = list(out)
+        self.err = list(err)
+        self.exit_status = exit_status
+        self.eof_polls = eof_polls
+        self.polls = 0
+        self.command = None
+
+    def execute(self, command):
+        self.command = command
+        return 0
+
+    def read(self, size):
+        return self.out.pop(0) if self.out else (0, b"")
+
+    def read_stderr(self, size):
+        return self.err.pop(0) if self.err else (0, b"")
+
+    def eof(self):
+        self.polls += 1
+        if self.eof_polls is not None:
+            return self.polls >= self.eof_polls
+        return not self.out and not self.err
+
+    def close(self):
+        return 0
+
+    def wait_closed(self):
+        return 0
+
+    def get_exit_status(self):
+        return self.exit_status
+
+
+class FakeSession:
+    """Сессия libssh2: open_session отдает каналы из channels по очереди."""
+
+    def __init__(self):
+        self.channels = []
+        self.handshake_error = None
+
+    def flag(self, flag):
+        pass
+
+    def handshake(self, sock):
+        if self.handshake_error is not None:
+            raise self.handshake_error
+
+    def userauth_publickey_fromfile(self, user, key):
+        pass
+
+    def set_blocking(self, blocking):
+        pass
+
+    def block_directions(self):
+        return ssh_backend.LIBSSH2_SESSION_BLOCK_INBOUND
+
+    def open_session(self):
+        return self.channels.pop(0)
+
+    def disconnect(self):
+        pass
+
+
+@pytest.fixture
+def session():
+    """Сессия, которую получит клиент; сокет и select замоканы."""
+    fake = FakeSession()
+    with (
+        patch("infra.ssh_backend.Session", return_value=fake),
+        patch("infra.ssh_backend._open_socket", return_value=MagicMock()) as open_socket,
+        patch("infra.ssh_backend.select.select") as select,
+    ):
+        fake.sock = open_socket.return_value
+        fake.select = select
+        yield fake
+
+
+def test_run_command_reads_stdout_and_stderr_interleaved(session):
+    """
+    stdout и stderr читаются попеременно; если оба вернули EAGAIN, клиент
+    ждет сокет (select), а после EOF канала выходит из цикла.
+    """
+    session.channels.append(FakeChannel(
+        out=[(3, b"out"), AGAIN, AGAIN, (4, b"more"), AGAIN],
+        err=[(3, b"err"), AGAIN, AGAIN, (2, b"!!"), AGAIN],
+        exit_status=3,
+    ))
+    client = Ssh2Client("10.0.0.1", "root", "/key")
+
+    assert client.run_command("cmd") == (b"outmore", b"err!!", 3)
+    session.select.assert_called_once_with([session.sock], [], [], ssh_backend._SELECT_TIMEOUT)
+
+
+def test_run_command_waits_when_one_stream_is_at_eof(session):
+    """
+    stdout уже на EOF (read -> 0), stderr -> EAGAIN, а chan.eof() еще False:
+    каждый пустой проход ждет сокет, а не крутится вхолостую.
+    """
+    session.channels.append(FakeChannel(err=[AGAIN] * 3, eof_polls=3))
+    client = Ssh2Client("10.0.0.1", "root", "/key")
+
+    assert client.run_command("cmd") == (b"", b"", 0)
+    assert session.select.call_count == 2
+
+
+def test_run_command_streams_lines_with_trailing_partial(session):
+    """on_line получает полные строки по мере чтения и хвост без перевода строки в конце."""
+    session.channels.append(FakeChannel(out=[(3, b"a\nb"), AGAIN, (3, b"c\nd"), AGAIN]))
+    client = Ssh2Client("10.0.0.1", "root", "/key")
+    lines = []
+
+    out, _, _ = client.run_command("cmd", on_line=lines.append)
+
+    assert out == b"a\nbc\nd"
+    assert lines == [b"a", b"bc", b"d"]
+
+
+def test_run_command_read_error_marks_client_dead(session):
+    """Отрицательный код чтения (не EAGAIN) -> SSHException, соединение мертво."""
+    session.channels.append(FakeChannel(out=[(-7, b"")], eof_polls=10))
+    client = Ssh2Client("10.0.0.1", "root", "/key")
+
+    with pytest.raises(paramiko.SSHException, match="read failed: -7"):
+        client.run_command("cmd")
+
+    assert client.get_transport().is_active() is False
+
+
+def test_connect_handshake_failure_closes_socket(session):
+    """Ошибка handshake -> SSHException, сокет закрыт."""
+    session.handshake_error = SSH2Error("kex failed")
+
+    with pytest.raises(paramiko.SSHException, match="ssh2 connect to 10.0.0.1 failed"):
+        Ssh2Client("10.0.0.1", "root", "/key")
+
+    session.sock.close.assert_called_once()
+
+
+def test_run_command_does_not_block_other_commands(session):
+    """
+    Долгая команда (ожидание IP) не держит соединение: вторая команда
+    в другом потоке выполняется, пока первая ждет данных.
+    """
+    release = threading.Event()
+    slow = FakeChannel(eof_polls=1)
+    slow.eof = release.is_set
+    session.channels.extend([slow, FakeChannel(out=[(4, b"fast")])])
+    session.select.side_effect = lambda *args: time.sleep(0.001)
+    client = Ssh2Client("10.0.0.1", "root", "/key")
+    results = {}
+
+    slow_thread = threading.Thread(target=lambda: results.update(slow=client.run_command("slow")))
+    slow_thread.start()
+    try:
+        while not slow.command:
+            time.sleep(0.001)
+        fast_thread = threading.Thread(target=lambda: results.update(fast=client.run_command("fast")))
+        fast_thread.start()
+        fast_thread.join(timeout=5)
+
+        assert results.get("fast") == (b"fast", b"", 0)
+        assert "slow" not in results
+    finally:
+        release.set()
+        slow_thread.join(timeout=5)
+
+    assert results["slow"] == (b"", b"", 0)
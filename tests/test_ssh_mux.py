@@ -0,0 +1,129 @@
+"""
+Тесты бэкенда OpenSSH (infra/ssh_mux.py).
+
+SSH не используется: вместо `ssh` команда выполняется локальным shell
+(последний аргумент командной строки), мастер-соединение замокано.
+"""
+import subprocess
+from unittest.mock import MagicMock, patch
+
+import paramiko
+import pytest
+
+from infra.ssh_mux import OpenSshClient
+
+_real_popen = subprocess.Popen
+
+
+def local_popen(argv, **kwargs):
+    """Выполняет удаленную команду (последний аргумент ssh) локально."""
+    return _real_popen(["sh", "-c", argv[-1]], **kwargs)
+
+
+@pytest.fixture
+def mock_run():
+    """Мастер-соединение уже запущено (ssh -O check успешен)."""
+    with patch("infra.ssh_mux.subprocess.run") as run:
+        run.return_value = MagicMock(returncode=0)
+        yield run
+
+
+def control_commands(mock_run):
+    """Управляющие команды мастера (-O ...) из вызовов subprocess.run."""
+    return [
+        call.args[0][-2] for call in mock_run.call_args_list if call.args[0][-3] == "-O"
+    ]
+
+
+def test_client_uses_control_master(mock_run):
+    """Команды идут через общий ControlPath с заданным ключом."""
+    client = OpenSshClient("10.0.0.1", "root", "/key")
+
+    argv = mock_run.call_args[0][0]
+    assert argv[:3] == ["ssh", "-i", "/key"]
+    assert "ControlMaster=auto" in argv
+    assert argv[-3:] == ["-O", "check", "root@10.0.0.1"]
+    # Живой мастер переиспользуется — новый не запускается
+    mock_run.assert_called_once()
+    assert client.get_transport().is_active()
+
+
+def test_client_starts_master_when_absent(mock_run):
+    """
+    Если мастера нет, он запускается в фоне (-M -N -f). Фоновый мастер
+    наследует stdout/stderr, поэтому каналов (PIPE) у него нет — иначе run()
+    ждал бы завершения мастера.
+    """
+    mock_run.side_effect = [MagicMock(returncode=255), MagicMock(returncode=0)]
+
+    OpenSshClient("10.0.0.1", "root", "/key")
+
+    assert mock_run.call_args[0][0][-4:] == ["-M", "-N", "-f", "root@10.0.0.1"]
+    kwargs = mock_run.call_args.kwargs
+    assert "capture_output" not in kwargs
+    assert kwargs["stdout"] == subprocess.DEVNULL
+    assert kwargs["stderr"] is not subprocess.PIPE
+
+
+def test_client_master_failure_raises(mock_run):
+    """Ошибка запуска мастера -> paramiko.SSHException с текстом ssh."""
+    def fake_run(argv, **kwargs):
+        if "-M" not in argv:
+            return MagicMock(returncode=255)
+        kwargs["stderr"].write(b"ssh: connect to host 10.0.0.1 port 22: Connection refused")
+        return MagicMock(returncode=255)
+
+    mock_run.side_effect = fake_run
+
+    with pytest.raises(paramiko.SSHException, match="Connection refused"):
+        OpenSshClient("10.0.0.1", "root", "/key")
+
+
+def test_client_inactive_when_master_dies(mock_run):
+    """is_active проверяет мастер (-O check): упавший мастер -> пул переподключится."""
+    client = OpenSshClient("10.0.0.1", "root", "/key")
+    assert client.is_active()
+
+    mock_run.return_value = MagicMock(returncode=255)
+    assert not client.is_active()
+
+
+def test_close_stops_own_master_only(mock_run):
+    """close() останавливает мастер, запущенный клиентом; чужой мастер не трогает."""
+    # Мастер уже был (чужой): только -O check
+    OpenSshClient("10.0.0.1", "root", "/key").close()
+    assert control_commands(mock_run) == ["check"]
+
+    # Мастер запущен клиентом: при закрытии -O exit
+    mock_run.reset_mock()
+    mock_run.side_effect = [MagicMock(returncode=255), MagicMock(returncode=0), MagicMock(returncode=0)]
+    client = OpenSshClient("10.0.0.1", "root", "/key")
+    client.close()
+    client.close()
+    assert control_commands(mock_run) == ["check", "exit"]
+    assert not client.is_active()
+
+
+@patch("infra.ssh_mux.subprocess.Popen", side_effect=local_popen)
+def test_run_command_streams_output(mock_popen, mock_run):
+    """stdout и stderr вычитываются вместе, строки stdout передаются в on_line."""
+    client = OpenSshClient("10.0.0.1", "root", "/key")
+    lines = []
+
+    out, err, rc = client.run_command("echo one; echo err >&2; echo two; exit 3", on_line=lines.append)
+
+    assert (out, err, rc) == (b"one\ntwo\n", b"err\n", 3)
+    assert lines == [b"one", b"two"]
+
+
+@patch("infra.ssh_mux.subprocess.Popen", side_effect=local_popen)
+def test_run_command_ssh_error_raises(mock_popen, mock_run):
+    """Код 255 с ошибкой самого ssh -> paramiko.SSHException."""
+    client = OpenSshClient("10.0.0.1", "root", "/key")
+
+    with pytest.raises(paramiko.SSHException, match="Connection closed"):
+        client.run_command("echo 'Connection closed by 10.0.0.1 port 22' >&2; exit 255")
+
+    # 255 от удаленной команды (qm guest cmd без агента) — обычный код возврата
+    _, _, rc = client.run_command("echo 'QEMU guest agent is not running' >&2; exit 255")
+    assert rc == 255
@@ -0,0 +1,143 @@
+"""
+Тесты пула SSH соединений (infra/ssh_pool.py).
+
+Реальные соединения не создаются: paramiko.SSHClient замокан.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from infra import ssh_pool
+from infra.ssh_pool import get_client
+
+
+@pytest.fixture
+def empty_pool():
+    """Изолирует тест от глобального пула SSH соединений."""
+    saved = dict(ssh_pool._ssh_pool)
+    ssh_pool._ssh_pool.clear()
+    yield ssh_pool._ssh_pool
+    ssh_pool._ssh_pool.clear()
+    ssh_pool._ssh_pool.update(saved)
+
+
+@pytest.fixture(autouse=True)
+def mock_socket():
+    """Не открываем реальные TCP соединения."""
+    with patch("infra.ssh_pool.socket.create_connection") as mock_connect:
+        yield mock_connect
+
+
+@patch("paramiko.SSHClient")
+def test_get_client_reuses_live_connection(mock_client_cls, empty_pool, mock_socket):
+    """Повторный запрос того же узла не создает новое SSH соединение."""
+    first = get_client("10.0.0.1", "root", "/key")
+    second = get_client("10.0.0.1", "root", "/key")
+
+    assert first is second
+    mock_client_cls.assert_called_once()
+    first.connect.assert_called_once_with(
+        "10.0.0.1",
+        username="root",
+        key_filename="/key",
+        compress=True,
+        sock=mock_socket.return_value,
+        look_for_keys=False,
+        allow_agent=False,
+        disabled_algorithms=ssh_pool.SSH_DISABLED_ALGORITHMS,
+        banner_timeout=ssh_pool.SSH_BANNER_TIMEOUT,
+        auth_timeout=ssh_pool.SSH_AUTH_TIMEOUT,
+    )
+    first.load_system_host_keys.assert_called_once_with()
+    first.get_transport.return_value.set_keepalive.assert_called_once_with(
+        ssh_pool.SSH_KEEPALIVE_INTERVAL
+    )
+
+
+@patch("paramiko.SSHClient")
+def test_get_client_reconnects_dead_transport(mock_client_cls, empty_pool):
+    """Если транспорт неактивен, соединение пересоздается."""
+    dead, fresh = MagicMock(), MagicMock()
+    dead.get_transport.return_value.is_active.return_value = False
+    mock_client_cls.side_effect = [dead, fresh]
+
+    assert get_client("10.0.0.1", "root", "/key") is dead
+    assert get_client("10.0.0.1", "root", "/key") is fresh
+    dead.close.assert_called_once()
+
+
+def test_open_socket_disables_nagle(mock_socket):
+    """Сокет SSH открывается с TCP_NODELAY; буферы остаются на автонастройке ядра."""
+    sock = ssh_pool._open_socket("10.0.0.1")
+
+    mock_socket.assert_called_once_with(("10.0.0.1", 22), timeout=ssh_pool.SSH_CONNECT_TIMEOUT)
+    sock.settimeout.assert_called_once_with(None)
+    sock.setsockopt.assert_called_once_with(
+        ssh_pool.socket.IPPROTO_TCP, ssh_pool.socket.TCP_NODELAY, 1
+    )
+
+
+@patch("paramiko.SSHClient")
+def test_close_all_clients_empties_pool(mock_client_cls, empty_pool):
+    """close_all_clients закрывает соединения и очищает пул."""
+    client = get_client("10.0.0.1", "root", "/key")
+
+    ssh_pool.close_all_clients()
+
+    client.close.assert_called_once()
+    assert not empty_pool
+
+
+def test_get_client_unknown_backend(empty_pool):
+    """Неизвестный бэкенд в config.yaml — понятная ошибка, а не AttributeError."""
+    with pytest.raises(ValueError, match="Unknown SSH backend"):
+        get_client("10.0.0.1", "root", "/key", backend="telnet")
+
+
+@patch("paramiko.SSHClient")
+def test_acquire_keeps_live_client_and_evicts_dead(mock_client_cls, empty_pool):
+    """acquire возвращает соединение в пул; умершее соединение удаляется."""
+    with ssh_pool.acquire("10.0.0.1", "root", "/key") as client:
+        pass
+    client.close.assert_not_called()
+    assert client in empty_pool.values()
+
+    with ssh_pool.acquire("10.0.0.1", "root", "/key") as same:
+        same.get_transport.return_value.is_active.return_value = False
+    assert same is client
+    client.close.assert_called_once()
+    assert not empty_pool
+
+
+@patch("paramiko.SSHClient")
+def test_get_client_closes_socket_on_auth_failure(mock_client_cls, empty_pool, mock_socket):
+    """Ошибка handshake/аутентификации: сокет закрывается, в пул ничего не попадает."""
+    mock_client_cls.return_value.connect.side_effect = Exception("Authentication failed")
+
+    with pytest.raises(Exception, match="Authentication failed"):
+        get_client("10.0.0.1", "root", "/key")
+
+    mock_socket.return_value.close.assert_called_once()
+    assert empty_pool == {}
+
+
+def test_get_client_connects_nodes_in_parallel(empty_pool):
+    """Handshake к разным узлам не сериализуется общей блокировкой пула."""
+    # Оба подключения должны одновременно дойти до барьера; при
+    # последовательном подключении первое ждало бы второе до таймаута
+    barrier = threading.Barrier(2, timeout=5)
+
+    def slow_connect(host, user, key, backend):
+        barrier.wait()
+        return MagicMock()
+
+    with patch("infra.ssh_pool._connect", side_effect=slow_connect):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            clients = list(executor.map(
+                lambda host: get_client(host, "root", "/key"), ["10.0.0.1", "10.0.0.2"]
+            ))
+
+    assert clients[0] is not clients[1]
+    assert len(empty_pool) == 2
@@ -0,0 +1,363 @@
+"""
+Тесты утилит SSH (infra/ssh_utils.py).
+
+SSH не используется: SSH канал, execute_ssh_command и time.sleep замоканы,
+проверяется только логика чтения, опроса и разбора ответов.
+"""
+import json
+from unittest.mock import MagicMock, patch
+
+import paramiko
+import pytest
+
+from infra import ssh_utils
+from infra.ssh_utils import (
+    IP_POLL_INTERVAL,
+    _parse_lan_ip,
+    _remote_poll_delays,
+    execute_ssh_command,
+    execute_ssh_script,
+    wait_for_ip,
+    wait_for_ips,
+)
+
+# Типичный ответ QEMU Guest Agent (network-get-interfaces)
+AGENT_REPLY = json.dumps([
+    {"name": "lo", "ip-addresses": [
+        {"ip-address-type": "ipv4", "ip-address": "127.0.0.1"},
+    ]},
+    {"name": "eth0", "ip-addresses": [
+        {"ip-address-type": "ipv6", "ip-address": "fe80::1"},
+        {"ip-address-type": "ipv4", "ip-address": "10.33.33.101"},
+    ]},
+])
+
+
+class FakeChannel:
+    """
+    Минимальная имитация paramiko.Channel: данные уже получены целиком,
+    EOF пришел, exit status известен.
+    """
+
+    def __init__(self, stdout=b"", stderr=b"", exit_status=0):
+        self._out = bytearray(stdout)
+        self._err = bytearray(stderr)
+        self._exit_status = exit_status
+        self.eof_received = True
+        self.closed = False
+        self.command = None
+
+    def exec_command(self, command):
+        self.command = command
+
+    def shutdown_write(self):
+        pass
+
+    def recv_ready(self):
+        return bool(self._out)
+
+    def recv_stderr_ready(self):
+        return bool(self._err)
+
+    def recv(self, nbytes):
+        chunk, self._out = bytes(self._out[:nbytes]), self._out[nbytes:]
+        return chunk
+
+    def recv_stderr(self, nbytes):
+        chunk, self._err = bytes(self._err[:nbytes]), self._err[nbytes:]
+        return chunk
+
+    def recv_exit_status(self):
+        return self._exit_status
+
+    def exit_status_ready(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+def make_client(channel):
+    """SSH клиент, у которого транспорт открывает заданный канал."""
+    client = MagicMock()
+    client.get_transport.return_value.open_session.return_value = channel
+    return client
+
+
+def test_execute_ssh_command_drains_large_stderr():
+    """stdout и stderr больше одного блока чтения вычитываются полностью."""
+    big_err = b"w" * 200_000
+    chan = FakeChannel(stdout=b"line1\nline2\n", stderr=big_err)
+
+    out = execute_ssh_command(make_client(chan), "qm list", print_output=False)
+
+    assert out == "line1\nline2"
+    assert chan.command == "qm list"
+    assert chan.closed, "Канал должен закрываться после выполнения"
+
+
+def test_execute_ssh_command_opens_channel_with_large_window():
+    """Канал открывается с увеличенным окном и размером пакета."""
+    client = make_client(FakeChannel(stdout=b"ok"))
+
+    execute_ssh_command(client, "true", print_output=False)
+
+    client.get_transport.return_value.open_session.assert_called_once_with(
+        window_size=ssh_utils.SSH_WINDOW_SIZE,
+        max_packet_size=ssh_utils.SSH_MAX_PACKET_SIZE,
+    )
+
+
+@patch("infra.ssh_utils.select.select")
+def test_execute_ssh_command_returns_on_exit_without_eof(mock_select):
+    """
+    Команда завершилась, но EOF не пришел (фоновый потомок держит stdout):
+    чтение завершается по exit status, а не зависает.
+    """
+    chan = FakeChannel(stdout=b"started\n")
+    chan.eof_received = False
+
+    assert execute_ssh_command(make_client(chan), "nohup daemon &", print_output=False) == "started"
+    assert mock_select.called
+
+
+def test_execute_ssh_command_streams_output_lines(caplog):
+    """print_output=True пишет stdout в лог построчно, без прогресс-бара."""
+    chan = FakeChannel(stdout=b"create full clone\ntransferred 1 GiB of 2 GiB (50.00%)\ndone")
+
+    with caplog.at_level("INFO", logger="ssh_utils"):
+        out = execute_ssh_command(make_client(chan), "qm clone 100 200")
+
+    assert out == "create full clone\ndone"
+    logged = [r.getMessage() for r in caplog.records if r.getMessage().startswith("STDOUT")]
+    assert logged == ["STDOUT: create full clone", "STDOUT: done"]
+
+
+def test_execute_ssh_command_keeps_output_without_filter_progress():
+    """С filter_progress=False вывод возвращается как есть."""
+    chan = FakeChannel(stdout=b"create full clone\ntransferred 1 GiB of 2 GiB (50.00%)")
+
+    out = execute_ssh_command(
+        make_client(chan), "cat /tmp/log", print_output=False, filter_progress=False
+    )
+
+    assert out == "create full clone\ntransferred 1 GiB of 2 GiB (50.00%)"
+
+
+@patch("infra.ssh_utils._log_stdout_line")
+def test_execute_ssh_command_skips_streaming_when_info_disabled(mock_log_line, caplog):
+    """Если INFO отключен, строки stdout не обрабатываются для лога."""
+    chan = FakeChannel(stdout=b"line1\nline2")
+
+    with caplog.at_level("WARNING", logger="ssh_utils"):
+        assert execute_ssh_command(make_client(chan), "qm list") == "line1\nline2"
+
+    mock_log_line.assert_not_called()
+
+
+def test_execute_ssh_command_raises_with_stderr():
+    """Ненулевой код возврата -> исключение с текстом stderr."""
+    chan = FakeChannel(stderr=b"VM 200 not found", exit_status=2)
+
+    with pytest.raises(Exception, match="VM 200 not found"):
+        execute_ssh_command(make_client(chan), "qm status 200")
+
+
+def test_execute_ssh_command_return_status():
+    """return_status=True возвращает (stdout, exit_status) без исключения."""
+    chan = FakeChannel(stdout=b"", exit_status=2)
+
+    out, rc = execute_ssh_command(
+        make_client(chan), "qm status 200", ignore_errors=True, return_status=True
+    )
+    assert (out, rc) == ("", 2)
+
+
+def test_execute_ssh_command_uses_backend_run_command():
+    """Клиент альтернативного бэкенда выполняет команду сам (run_command)."""
+    class FakeBackendClient:
+        def run_command(self, command, on_line=None):
+            self.command = command
+            return b"out\n", b"", 0
+
+    client = FakeBackendClient()
+
+    assert execute_ssh_command(client, "qm list", print_output=False) == "out"
+    assert client.command == "qm list"
+
+
+@patch("infra.ssh_utils.time.sleep")
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_wait_for_ip_single_remote_loop(mock_exec, mock_sleep):
+    """Ожидание идет одним SSH вызовом: цикл опроса выполняется на хосте."""
+    mock_exec.return_value = (AGENT_REPLY, 0)
+
+    assert wait_for_ip(MagicMock(), 101) == "10.33.33.101"
+    mock_exec.assert_called_once()
+    mock_sleep.assert_not_called()
+    assert mock_exec.call_args.kwargs["binary"] is True
+
+    script = mock_exec.call_args[0][1]
+    assert "qm guest cmd 101 network-get-interfaces" in script
+    assert "while" in script
+    assert "jq -r" in script
+
+
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_wait_for_ip_poll_interval(mock_exec):
+    """Паузы удаленного цикла растут от 0.25с и ограничены poll_interval."""
+    mock_exec.return_value = (AGENT_REPLY, 0)
+
+    wait_for_ip(MagicMock(), 101, poll_interval=0.5)
+
+    assert "set -- 0.25 0.4 0.5;" in mock_exec.call_args[0][1]
+
+
+def test_remote_poll_delays_default():
+    """По умолчанию паузы растут в 1.6 раза до 2с."""
+    assert _remote_poll_delays(IP_POLL_INTERVAL) == "0.25 0.4 0.64 1.02 1.64 2"
+
+
+@patch("infra.ssh_utils.time.sleep")
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_wait_for_ip_remote_timeout(mock_exec, mock_sleep):
+    """Удаленный цикл вернул код 1 (таймаут) -> None без повторных вызовов."""
+    mock_exec.return_value = ("", 1)
+
+    assert wait_for_ip(MagicMock(), 101) is None
+    mock_exec.assert_called_once()
+
+
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_wait_for_ip_parses_output_before_status(mock_exec):
+    """Адрес в выводе принимается, даже если код возврата не получен (-1)."""
+    mock_exec.return_value = (b"10.33.33.101", -1)
+
+    assert wait_for_ip(MagicMock(), 101) == "10.33.33.101"
+    mock_exec.assert_called_once()
+
+
+def test_parse_lan_ip_skips_loopback_and_ipv6():
+    """Берется первый IPv4 из сети 10.x, loopback и IPv6 пропускаются."""
+    assert _parse_lan_ip(AGENT_REPLY) == "10.33.33.101"
+    assert _parse_lan_ip('[{"name": "lo", "ip-addresses": []}]') is None
+
+
+def test_parse_lan_ip_accepts_bytes():
+    """Ответ в bytes (binary=True) разбирается без декодирования в str."""
+    assert _parse_lan_ip(AGENT_REPLY.encode()) == "10.33.33.101"
+    assert _parse_lan_ip(b"10.33.33.101\n") == "10.33.33.101"
+
+
+def test_execute_ssh_command_binary_returns_bytes():
+    """binary=True возвращает stdout как bytes без фильтрации."""
+    chan = FakeChannel(stdout=b'  [{"name": "eth0"}]\n')
+
+    out, rc = execute_ssh_command(
+        make_client(chan), "qm guest cmd", print_output=False,
+        return_status=True, binary=True,
+    )
+    assert (out, rc) == (b'[{"name": "eth0"}]', 0)
+
+
+@patch("infra.ssh_utils._json_loads")
+def test_parse_lan_ip_regex_skips_json_parse(mock_loads):
+    """Адрес находится регулярным выражением по байтам — JSON не разбирается."""
+    pretty = json.dumps(json.loads(AGENT_REPLY), indent=3, sort_keys=True).encode()
+
+    assert _parse_lan_ip(pretty) == "10.33.33.101"
+    mock_loads.assert_not_called()
+
+
+@patch("infra.ssh_utils._json_loads")
+def test_parse_lan_ip_accepts_address_extracted_by_jq(mock_loads):
+    """Если адрес извлек jq на хосте, JSON не разбирается."""
+    assert _parse_lan_ip("10.33.33.101\n") == "10.33.33.101"
+    assert _parse_lan_ip("") is None
+    mock_loads.assert_not_called()
+
+
+@patch("infra.ssh_utils.time.sleep")
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_wait_for_ip_retries_transport_and_parse_errors(mock_exec, mock_sleep):
+    """Обрыв SSH и битый JSON не прерывают ожидание — пробуем снова с нарастающей задержкой."""
+    mock_exec.side_effect = [
+        paramiko.SSHException("connection reset"),
+        ('[{"name": "eth0", "ip-addresses": [{"ip-address-type": "ipv4"', 0),  # обрезанный JSON
+        (AGENT_REPLY, 0),
+    ]
+
+    assert wait_for_ip(MagicMock(), 101, timeout=600) == "10.33.33.101"
+    assert mock_exec.call_count == 3
+
+    delays = [c.args[0] for c in mock_sleep.call_args_list]
+    assert delays[0] == 0.5
+    assert delays == sorted(delays), "Задержка не должна уменьшаться"
+    assert max(delays) <= 3.0
+
+
+@patch("infra.ssh_utils.time.sleep")
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_wait_for_ip_propagates_unexpected_errors(mock_exec, mock_sleep):
+    """Непредвиденные исключения (ошибки в коде) не маскируются повторами."""
+    mock_exec.side_effect = RuntimeError("bug")
+
+    with pytest.raises(RuntimeError):
+        wait_for_ip(MagicMock(), 101)
+    mock_sleep.assert_not_called()
+
+
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_wait_for_ip_dry_run(mock_exec):
+    """В dry-run SSH не вызывается, возвращается фиктивный IP."""
+    assert wait_for_ip(MagicMock(), 101, dry_run=True) == "10.DRY.RUN.IP"
+    mock_exec.assert_not_called()
+
+
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_execute_ssh_script_single_exec(mock_exec):
+    """Все шаги уходят одним вызовом, вывод разбирается по маркерам шагов."""
+    mock_exec.return_value = (
+        "==STEP:clone==\ncreate full clone\n==STEP:start==\n==STEP:status==\nstatus: running"
+    )
+
+    result = execute_ssh_script(MagicMock(), [
+        ("clone", "qm clone 100 200"),
+        ("start", "qm start 200"),
+        ("status", "qm status 200"),
+    ])
+
+    mock_exec.assert_called_once()
+    script = mock_exec.call_args[0][1]
+    assert script.startswith("bash -s <<")
+    assert "set -e" in script
+    assert script.index("qm clone 100 200") < script.index("qm start 200")
+    assert result == {
+        "clone": "create full clone",
+        "start": "",
+        "status": "status: running",
+    }
+
+
+@patch("infra.ssh_utils.execute_ssh_command")
+def test_execute_ssh_script_reports_failed_step(mock_exec):
+    """При ошибке в исключении указан упавший шаг."""
+    mock_exec.side_effect = Exception("SSH Command failed: ==FAILED:clone==")
+
+    with pytest.raises(Exception, match="step 'clone'"):
+        execute_ssh_script(MagicMock(), [("clone", "qm clone 100 200")])
+
+
+@patch("infra.ssh_utils.wait_for_ip")
+def test_wait_for_ips_waits_all_vms(mock_wait):
+    """wait_for_ips ждет все ВМ на общем клиенте и возвращает {vm_id: ip}."""
+    mock_wait.side_effect = lambda client, vm_id, dry_run, timeout: (
+        None if vm_id == 102 else f"10.0.0.{vm_id - 100}"
+    )
+    client = MagicMock()
+
+    assert wait_for_ips(client, [101, 102, 103], timeout=5) == {
+        101: "10.0.0.1", 102: None, 103: "10.0.0.3",
+    }
+    assert {c.args[0] for c in mock_wait.call_args_list} == {client}
+    assert wait_for_ips(client, []) == {}